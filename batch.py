@@ -0,0 +1,228 @@
+from array import array
+from random import Random
+
+from game_classes import BOARD_SIZE, FLEET, Game, Player, split_rng
+from simulator import GameResult, SimulationError
+
+# result codes of BoardBatch.shot, 0 - no shot made in the game
+MISS_CODE = 1
+HIT_CODE = 2
+KILL_CODE = 3
+LOOSE_CODE = 4
+OCCUPIED_CODE = 5
+OUT_CODE = 6
+
+
+class BoardBatch:
+#   count boards of the same size and fleet in flat arrays, cell (x, y) of board k is k * area + x * width + y,
+#   ship s of board k has its lives in lives[k * ships + s]
+    def __init__(self, count, board_size=BOARD_SIZE, fleet=FLEET, height=None):
+        self.count = count
+        self.width = board_size
+        self.height = board_size if height is None else height
+        self.area = self.width * self.height
+        self.fleet = tuple(fleet)
+        self.ships = len(self.fleet)
+#       the number of the ship in the cell, -1 - no ship
+        self.ship_at = array('h', [-1]) * (count * self.area)
+        self.shots = bytearray(count * self.area)
+        self.lives = array('h', [0]) * (count * self.ships)
+        self.alive = array('h', [0]) * count
+
+    def place_layout(self, board, layout):
+#       layout is [(length, start dot, orientation)] of the ships, as PlacementBook.get_layout returns it
+        base = board * self.area
+        for cell in range(base, base + self.area):
+            self.ship_at[cell] = -1
+            self.shots[cell] = 0
+        for number, (length, start_point, orientation) in enumerate(layout):
+            step = 1 if orientation else self.width
+            cell = base + start_point.x * self.width + start_point.y
+            for _ in range(length):
+                self.ship_at[cell] = number
+                cell += step
+            self.lives[board * self.ships + number] = length
+        self.alive[board] = len(layout)
+
+    def place_random(self, rng, book=None):
+#       the layouts are taken from the book if there is one, otherwise placed by add_ships_random
+        player = Player(self.width, self.height, rng)
+        for board in range(self.count):
+            if book is not None:
+                layout = book.get_random_layout(rng)
+            else:
+                player.player_board.erase_ships()
+                ships = Game.make_ships(self.fleet)
+                player.add_ships_random(ships)
+                layout = [(ship.length, ship.start_point, ship.orientation) for ship in ships]
+            self.place_layout(board, layout)
+
+    def shot(self, cells):
+#       cells[k] is the cell shot at on board k or -1 for no shot, returns the result codes of all the boards
+        codes = bytearray(self.count)
+        area, ships = self.area, self.ships
+        ship_at, shots, lives, alive = self.ship_at, self.shots, self.lives, self.alive
+        for board, cell in enumerate(cells):
+            if cell < 0 or not alive[board]:
+                continue
+            if cell >= area:
+                codes[board] = OUT_CODE
+                continue
+            pos = board * area + cell
+            if shots[pos]:
+                codes[board] = OCCUPIED_CODE
+                continue
+            shots[pos] = 1
+            ship = ship_at[pos]
+            if ship < 0:
+                codes[board] = MISS_CODE
+                continue
+            ship += board * ships
+            lives[ship] -= 1
+            if lives[ship]:
+                codes[board] = HIT_CODE
+            else:
+                alive[board] -= 1
+                codes[board] = KILL_CODE if alive[board] else LOOSE_CODE
+        return codes
+
+
+class BatchAi:
+#   the hunt and target strategy of Ai for count games at once: the edges of the wounded ship if there is one,
+#   otherwise the next free cell of the game's random order of all the cells
+    def __init__(self, count, board_size=BOARD_SIZE, height=None, rng=None):
+        self.count = count
+        self.width = board_size
+        self.height = board_size if height is None else height
+        self.area = self.width * self.height
+        self.rng = rng if rng is not None else Random()
+#       the free cells are neither shot nor known to be empty around a wounded or a killed ship, the edges
+#       of a wounded ship are only checked to be not shot, the same as Board.get_ships_edges does
+        self.free = bytearray(b'\x01') * (count * self.area)
+        self.shots = bytearray(count * self.area)
+        self.order = array('i')
+        cells = list(range(self.area))
+        for _ in range(count):
+            self.rng.shuffle(cells)
+            self.order.extend(cells)
+        self.next = array('i', [0]) * count
+        self.wounded = [[] for _ in range(count)]
+        self.neighbours = [self.__neighbours(cell, False) for cell in range(self.area)]
+        self.halo = [self.__neighbours(cell, True) for cell in range(self.area)]
+
+    def __neighbours(self, cell, diagonal):
+        x, y = divmod(cell, self.width)
+        cells = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                if (dx or dy) and (diagonal or not (dx and dy)):
+                    if 0 <= x + dx < self.height and 0 <= y + dy < self.width:
+                        cells.append((x + dx) * self.width + y + dy)
+        return tuple(cells)
+
+    def __edges(self, wounded):
+        if len(wounded) == 1:
+            return self.neighbours[wounded[0]]
+        first, last = min(wounded), max(wounded)
+        if first // self.width == last // self.width:
+            return tuple(cell for cell in (first - 1, last + 1) if cell // self.width == first // self.width
+                         and 0 <= cell < self.area)
+        return tuple(cell for cell in (first - self.width, last + self.width) if 0 <= cell < self.area)
+
+    def ask(self, active):
+#       active[k] - the AI shoots in the game k, returns the cells to shoot at, -1 in the other games
+        cells = array('i', [-1]) * self.count
+        area, free, shots, order, following = self.area, self.free, self.shots, self.order, self.next
+        for game in range(self.count):
+            if not active[game]:
+                continue
+            base = game * area
+            wounded = self.wounded[game]
+            if wounded:
+                edges = [cell for cell in self.__edges(wounded) if not shots[base + cell]]
+                if edges:
+                    cells[game] = edges[self.rng.randrange(len(edges))]
+                    continue
+            position = following[game]
+            while position < area and not free[base + order[base + position]]:
+                position += 1
+            following[game] = position
+            if position < area:
+                cells[game] = order[base + position]
+        return cells
+
+    def save_results(self, cells, codes):
+        area, free = self.area, self.free
+        for game, cell in enumerate(cells):
+            code = codes[game]
+            if cell < 0 or code not in (MISS_CODE, HIT_CODE, KILL_CODE, LOOSE_CODE):
+                continue
+            base = game * area
+            free[base + cell] = 0
+            self.shots[base + cell] = 1
+            if code == MISS_CODE:
+                continue
+            wounded = self.wounded[game]
+            wounded.append(cell)
+            if code != HIT_CODE:
+                for deck in wounded:
+                    for halo_cell in self.halo[deck]:
+                        free[base + halo_cell] = 0
+                wounded.clear()
+            else:
+#               the same cells as Board.save_result blocks, the area of the run except the run and its edges
+                known = set(wounded).union(self.__edges(wounded))
+                for deck in wounded:
+                    for halo_cell in self.halo[deck]:
+                        if halo_cell not in known:
+                            free[base + halo_cell] = 0
+
+
+class BatchSimulator:
+#   hunt Ai against hunt Ai in batches of games played in lockstep, the results are the same GameResult
+#   as the Simulator gives
+    def __init__(self, board_size=BOARD_SIZE, fleet=FLEET, height=None, book=None):
+        self.board_size = board_size
+        self.height = height
+        self.fleet = tuple(fleet)
+        self.book = book
+
+    def play_batch(self, count, seed=0):
+        rngs = split_rng(Random(seed), 4)
+        boards = [BoardBatch(count, self.board_size, self.fleet, self.height) for _ in range(2)]
+        for board, rng in zip(boards, rngs):
+            board.place_random(rng, self.book)
+        ais = [BatchAi(count, self.board_size, self.height, rng) for rng in rngs[2:]]
+        current = bytearray(count)
+        winner = array('b', [-1]) * count
+        turns = array('i', [1]) * count
+        shots = [array('i', [0]) * count for _ in range(2)]
+        hits = [array('i', [0]) * count for _ in range(2)]
+        playing = count
+        while playing:
+            for player in (0, 1):
+                active = [winner[game] < 0 and current[game] == player for game in range(count)]
+                cells = ais[player].ask(active)
+                codes = boards[1 - player].shot(cells)
+                ais[player].save_results(cells, codes)
+                for game in range(count):
+                    code = codes[game]
+                    if not code:
+                        continue
+                    shots[player][game] += 1
+                    if code == MISS_CODE:
+                        current[game] = 1 - player
+                        turns[game] += 1
+                    elif code in (HIT_CODE, KILL_CODE, LOOSE_CODE):
+                        hits[player][game] += 1
+                        if code == LOOSE_CODE:
+                            winner[game] = player
+                            playing -= 1
+                    else:
+                        raise SimulationError
+        return [GameResult(seed + game, winner[game], turns[game], (shots[0][game], shots[1][game]),
+                           (hits[0][game], hits[1][game])) for game in range(count)]
+
+    def run(self, games, seed=0, batch_size=1000):
+        for batch_seed in range(seed, seed + games, batch_size):
+            yield from self.play_batch(min(batch_size, seed + games - batch_seed), batch_seed)
@@ -0,0 +1,252 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from random import Random
+
+from game_classes import FLEET, Ai, Board, Dot, Game, Player, Ship
+from simulator import Simulator
+
+BENCHMARK_VERSION = 1
+
+
+def make_fleet(board_size, density):
+#   the default fleet repeated until the ships take about the density of the board cells
+    copies = max(1, round(density * board_size * board_size / sum(FLEET)))
+    return FLEET * copies
+
+
+def placed_player(board_size, fleet, rng):
+    player = Player(board_size, rng=rng)
+    player.add_ships_random(Game.make_ships(fleet))
+    return player
+
+
+def shuffled_cells(board_size, rng):
+    cells = [Dot(x, y) for x in range(board_size) for y in range(board_size)]
+    rng.shuffle(cells)
+    return cells
+
+
+def tracked_enemy(board_size, fleet, shots, rng):
+#   the board of the shots made at a placed fleet: the first shots of a random order, the results saved
+    target = placed_player(board_size, fleet, rng)
+    tracker = Ai(board_size, rng=rng)
+    for dot in shuffled_cells(board_size, rng)[:shots]:
+        if not tracker.enemy_board.is_shot(dot):
+            result = target.move(dot)
+            tracker.save_move(dot, result)
+    return tracker
+
+
+# every case is (setup, run): setup(board_size, fleet, rng) makes the state, it is not timed,
+# run(state) is timed and returns the number of the operations made
+
+def setup_shot(board_size, fleet, rng):
+    return placed_player(board_size, fleet, rng).player_board, shuffled_cells(board_size, rng)
+
+
+def run_shot(state):
+    board, cells = state
+    for dot in cells:
+        board.shot(dot)
+    return len(cells)
+
+
+def setup_free_dots(board_size, fleet, rng):
+    return tracked_enemy(board_size, fleet, board_size * board_size // 2, rng).enemy_board
+
+
+def run_free_dots(board):
+    for _ in range(20):
+        board.get_free_dots()
+    return 20
+
+
+def setup_ships_edges(board_size, fleet, rng):
+#   every ship of the fleet is hit once and is still alive
+    target = placed_player(board_size, fleet, rng)
+    tracker = Ai(board_size, rng=rng)
+    for ship in target.player_board.ships:
+        if ship.length > 1:
+            dot = ship.dots()[0]
+            tracker.save_move(dot, target.move(dot))
+    return tracker.enemy_board
+
+
+def run_ships_edges(board):
+    for _ in range(100):
+        board.get_ships_edges()
+    return 100
+
+
+def setup_append_ship(board_size, fleet, rng):
+#   the decks of the fleet in a random order, as the hits would come in a game
+    dots = [dot for ship in placed_player(board_size, fleet, rng).player_board.ships for dot in ship.dots()]
+    rng.shuffle(dots)
+    return Board(board_size), dots
+
+
+def run_append_ship(state):
+    board, dots = state
+    for dot in dots:
+        board.append_ship(Ship(1, dot, False))
+    return len(dots)
+
+
+def setup_add_ships_random(board_size, fleet, rng):
+    return [(Player(board_size, rng=rng), Game.make_ships(fleet)) for _ in range(5)]
+
+
+def run_add_ships_random(state):
+    for player, ships in state:
+        player.add_ships_random(ships)
+    return len(state)
+
+
+def setup_ai_ask(board_size, fleet, rng):
+    return tracked_enemy(board_size, fleet, board_size * board_size // 3, rng)
+
+
+def run_ai_ask(ai):
+    for _ in range(100):
+        ai.ask()
+    return 100
+
+
+def setup_game(board_size, fleet, rng):
+    return Simulator(board_size=board_size, fleet=fleet), rng.getrandbits(32)
+
+
+def run_game(state):
+    simulator, seed = state
+    for game_seed in range(seed, seed + 3):
+        simulator.play(game_seed)
+    return 3
+
+
+def setup_startup(board_size, fleet, rng):
+#   a new process of the game up to its first question, the input is closed so it ends there
+    return [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'main.py'), '--headless']
+
+
+def run_startup(command):
+    subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, check=True)
+    return 1
+
+
+BENCHMARKS = {
+    'shot': (setup_shot, run_shot),
+    'get_free_dots': (setup_free_dots, run_free_dots),
+    'get_ships_edges': (setup_ships_edges, run_ships_edges),
+    'append_ship': (setup_append_ship, run_append_ship),
+    'add_ships_random': (setup_add_ships_random, run_add_ships_random),
+    'ai_ask': (setup_ai_ask, run_ai_ask),
+    'game': (setup_game, run_game),
+    'startup': (setup_startup, run_startup),
+}
+# the full games on the larger boards take minutes, they are skipped, the startup doesn't depend on the size
+MAX_SIZES = {
+    'game': 30,
+    'startup': 6,
+}
+
+
+class BenchmarkRunner:
+    def __init__(self, cases=tuple(BENCHMARKS), sizes=(6, 10, 30, 100), densities=(0.05, 0.15), repeat=5, seed=0):
+        self.cases = tuple(cases)
+        self.sizes = tuple(sizes)
+        self.densities = tuple(densities)
+        self.repeat = repeat
+        self.seed = seed
+
+    def keys(self):
+        for case in self.cases:
+            for board_size in self.sizes:
+                if board_size > MAX_SIZES.get(case, board_size):
+                    continue
+                for density in self.densities:
+                    yield case, board_size, density
+
+    def measure(self, case, board_size, density):
+        setup, run = BENCHMARKS[case]
+        fleet = make_fleet(board_size, density)
+        times = []
+        for number in range(self.repeat):
+#           every repeat has its own seed, so the runs of the same code make the same moves
+            state = setup(board_size, fleet, Random(f"{self.seed}/{case}/{board_size}/{density}/{number}"))
+            start = time.perf_counter()
+            operations = run(state)
+            times.append((time.perf_counter() - start) / operations)
+        return {
+            'case': case,
+            'board_size': board_size,
+            'density': density,
+            'ships': len(fleet),
+            'median_us': statistics.median(times) * 1e6,
+            'min_us': min(times) * 1e6,
+        }
+
+    def run(self, report=None):
+        results = {}
+        for case, board_size, density in self.keys():
+            result = self.measure(case, board_size, density)
+            results[f"{case}/{board_size}/{density}"] = result
+            if report is not None:
+                report(result)
+        return {
+            'version': BENCHMARK_VERSION,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': self.seed,
+            'results': results,
+        }
+
+
+def compare(results, baseline, threshold=0.2):
+#   returns (key, baseline median, current median) of the benchmarks slower than the baseline by more than threshold
+    regressions = []
+    for key, result in results['results'].items():
+        base = baseline['results'].get(key)
+        if base is not None and result['median_us'] > base['median_us'] * (1 + threshold):
+            regressions.append((key, base['median_us'], result['median_us']))
+    return regressions
+
+
+def print_result(result):
+    print(f"{result['case']:>18} {result['board_size']:>5} {result['density']:>6} {result['ships']:>6} "
+          f"{result['median_us']:>14.2f} {result['min_us']:>14.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmarks of the Board and AI hot paths")
+    parser.add_argument('--cases', nargs='+', default=list(BENCHMARKS), choices=list(BENCHMARKS))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[6, 10, 30, 100])
+    parser.add_argument('--densities', nargs='+', type=float, default=[0.05, 0.15],
+                        help="part of the board cells taken by the ships")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', metavar='PATH', default=None, help="save the results as a JSON baseline")
+    parser.add_argument('--compare', metavar='PATH', default=None, help="report the regressions against this baseline")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="slowdown of the median counted as a regression, 0.2 - 20%%")
+    args = parser.parse_args()
+
+    runner = BenchmarkRunner(args.cases, args.sizes, args.densities, args.repeat, args.seed)
+    print(f"{'case':>18} {'size':>5} {'dens':>6} {'ships':>6} {'median us/op':>14} {'min us/op':>14}")
+    current = runner.run(print_result)
+    if args.save is not None:
+        with open(args.save, 'w') as file:
+            json.dump(current, file, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            regressions = compare(current, json.load(file), args.threshold)
+        for key, base, median in regressions:
+            print(f"regression {key}: {base:.2f} -> {median:.2f} us/op ({median / base - 1:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print("no regressions")
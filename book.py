@@ -0,0 +1,202 @@
+import mmap
+import os
+import struct
+from collections import OrderedDict
+from random import Random
+
+from game_classes import BOARD_SIZE, FLEET, Board, Dot
+
+BOOK_MAGIC = b'BSBK'
+BOOK_VERSION = 1
+
+
+class BookException(Exception):
+    def __init__(self, args="The file is not a placement book or has an unknown version!"):
+        Exception.__init__(self, args)
+
+
+def book_name(board_size, fleet, height=None):
+    height = board_size if height is None else height
+    return f"{board_size}x{height}-{'-'.join(str(length) for length in sorted(fleet, reverse=True))}.bsbk"
+
+
+class PlacementBook:
+#   magic, version, board size, height, ships count, opening length, layouts count, then the ship lengths
+#   longest first, the opening shots as x, y and the layouts as x, y and orientation of every ship
+    HEADER = struct.Struct('<4sBHHBHI')
+    DOT = struct.Struct('<hh')
+    SHIP = struct.Struct('<hhB')
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.map = None
+#       the games holding the book from BookCache.get to BookCache.release, a book evicted from the cache
+#       is closed when the last of them lets it go
+        self.users = 0
+        self.evicted = False
+
+    def open(self):
+#       the file is mapped when the book is used for the first time, a layout is read from its offset
+        if self.map is not None:
+            return
+        self.file = open(self.path, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, self.board_size, self.height, ships, openings, self.layouts = \
+                self.HEADER.unpack_from(self.map)
+        except (ValueError, struct.error):
+            self.close()
+            raise BookException
+        if magic != BOOK_MAGIC or version != BOOK_VERSION:
+            self.close()
+            raise BookException
+        offset = self.HEADER.size
+        self.fleet = tuple(self.map[offset:offset + ships])
+        offset += ships
+        self.opening = [Dot(*self.DOT.unpack_from(self.map, offset + i * self.DOT.size)) for i in range(openings)]
+        self.layouts_offset = offset + openings * self.DOT.size
+        self.layout_size = ships * self.SHIP.size
+
+    def get_layout(self, index):
+#       [(length, start dot, orientation)] of the ships, longest first
+        self.open()
+        offset = self.layouts_offset + index * self.layout_size
+        layout = []
+        for length in self.fleet:
+            x, y, orientation = self.SHIP.unpack_from(self.map, offset)
+            layout.append((length, Dot(x, y), bool(orientation)))
+            offset += self.SHIP.size
+        return layout
+
+    def get_random_layout(self, rng):
+        self.open()
+        return self.get_layout(rng.randrange(self.layouts))
+
+    def get_opening(self):
+        self.open()
+        return list(self.opening)
+
+    def place(self, player, ships, rng=None):
+#       places the ships the same as add_ships_random does, but on a layout from the book
+        layout = self.get_random_layout(player.rng if rng is None else rng)
+        if sorted(ship.length for ship in ships) != sorted(self.fleet):
+            raise BookException("The ships don't match the fleet of the book!")
+        for ship, (_, start_point, orientation) in zip(sorted(ships, key=lambda ship: -ship.length), layout):
+            ship.start_point = start_point
+            ship.orientation = orientation
+            player.player_board.add_ship(ship)
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    @classmethod
+    def build(cls, path, board_size=BOARD_SIZE, fleet=FLEET, layouts=10000, opening_length=16, seed=0, height=None):
+        from layouts import LayoutCounter
+        height = board_size if height is None else height
+        fleet = tuple(sorted(fleet, reverse=True))
+        rng = Random(seed)
+        counter = LayoutCounter(Board(board_size, height, rng), fleet)
+        records = []
+        masks = []
+        for _ in range(layouts):
+            ships = sorted(counter.sample(), key=lambda ship: -ship.length)
+            records.append(b''.join(cls.SHIP.pack(ship.start_point.x, ship.start_point.y, bool(ship.orientation))
+                                    for ship in ships))
+            mask = 0
+            for ship in ships:
+                for dot in ship.dots():
+                    mask |= 1 << (dot.x * board_size + dot.y)
+            masks.append(mask)
+        opening = cls.get_best_opening(masks, board_size, opening_length)
+        with open(path, 'wb') as file:
+            file.write(cls.HEADER.pack(BOOK_MAGIC, BOOK_VERSION, board_size, height, len(fleet), len(opening),
+                                       len(records)))
+            file.write(bytes(fleet))
+            for dot in opening:
+                file.write(cls.DOT.pack(dot.x, dot.y))
+            file.write(b''.join(records))
+
+    @staticmethod
+    def get_best_opening(masks, board_size, opening_length):
+#       every next shot is the cell taken by a ship in most of the layouts where all the shots before missed
+        opening = []
+        while masks and len(opening) < opening_length:
+            counts = {}
+            for mask in masks:
+                for cell in Board.iter_set_bits(mask):
+                    counts[cell] = counts.get(cell, 0) + 1
+            cell = max(counts, key=lambda cell: (counts[cell], -cell))
+            opening.append(Dot(*divmod(cell, board_size)))
+            masks = [mask for mask in masks if not mask >> cell & 1]
+        return opening
+
+
+class BookCache:
+#   the books of the fleet configurations used recently are kept open, the least recently used one is closed
+#   once no game holds it
+    def __init__(self, directory='books', capacity=8):
+        self.directory = directory
+        self.capacity = capacity
+        self.__books = OrderedDict()
+
+    def get(self, board_size=BOARD_SIZE, fleet=FLEET, height=None):
+#       returns the book of the configuration or None if there is no such book on disk,
+#       the book returned is given back by release when the game is done with it
+        key = book_name(board_size, fleet, height)
+        book = self.__books.get(key)
+        if book is not None:
+            self.__books.move_to_end(key)
+            book.users += 1
+            return book
+        path = os.path.join(self.directory, key)
+        if not os.path.exists(path):
+            return None
+        book = PlacementBook(path)
+        book.users += 1
+        self.__books[key] = book
+        if len(self.__books) > self.capacity:
+            _, evicted = self.__books.popitem(last=False)
+            evicted.evicted = True
+            if not evicted.users:
+                evicted.close()
+        return book
+
+    def release(self, book):
+        book.users -= 1
+        if book.evicted and not book.users:
+            book.close()
+
+    def __len__(self):
+        return len(self.__books)
+
+    def close(self):
+        for book in self.__books.values():
+            book.close()
+        self.__books.clear()
+
+
+if __name__ == '__main__':
+#   the game imports the book module, argparse is only needed here
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build a book of fleet layouts and opening shots")
+    parser.add_argument('--dir', default='books')
+    parser.add_argument('--board-size', type=int, default=BOARD_SIZE)
+    parser.add_argument('--height', type=int, default=None)
+    parser.add_argument('--fleet', type=int, nargs='+', default=list(FLEET))
+    parser.add_argument('--layouts', type=int, default=10000)
+    parser.add_argument('--opening-length', type=int, default=16)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    book_path = os.path.join(args.dir, book_name(args.board_size, args.fleet, args.height))
+    PlacementBook.build(book_path, args.board_size, args.fleet, args.layouts, args.opening_length, args.seed,
+                        args.height)
+    print(f"{book_path}: {args.layouts} layouts")
@@ -0,0 +1,255 @@
+from collections import Counter, OrderedDict
+from random import Random
+from threading import Lock
+from time import perf_counter
+
+from game_classes import FLEET, HIT_ST, Board, Dot
+
+MISS = 0
+HIT = 1
+KILL = 2
+
+
+class EndgameBudgetException(Exception):
+    def __init__(self, args="The endgame search is over its node or time budget!"):
+        Exception.__init__(self, args)
+
+
+class TranspositionTable:
+#   the solved positions of all the games of the process, the least recently used ones are dropped over
+#   the capacity, the lock keeps it whole when the AI moves are made in the worker threads
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self.__entries = OrderedDict()
+        self.__lock = Lock()
+
+    def get(self, key):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.__entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.__lock:
+            self.__entries[key] = entry
+            self.__entries.move_to_end(key)
+            if len(self.__entries) > self.capacity:
+                self.__entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+SHARED_TABLE = TranspositionTable()
+
+
+class ZobristKeys:
+#   a random 64 bit key of every cell, a ship is the XOR of its cells; the ship keys are mixed before they are
+#   summed into a layout and the layout keys before they are XORed into the position, so the same cells split
+#   into other ships give another key
+    MASK = (1 << 64) - 1
+#   the keys of the ships and the layouts met are kept until there are this many of them
+    MAX_CACHED = 100000
+
+    def __init__(self, seed=0x5EA):
+        self.__rng = Random(seed)
+        self.__cells = []
+        self.__ships = {}
+        self.__layouts = {}
+
+    def cell(self, cell):
+        while len(self.__cells) <= cell:
+            self.__cells.append(self.__rng.getrandbits(64))
+        return self.__cells[cell]
+
+    def ship(self, mask):
+        key = self.__ships.get(mask)
+        if key is None:
+            key = 0
+            for cell in Board.iter_set_bits(mask):
+                key ^= self.cell(cell)
+            if len(self.__ships) >= self.MAX_CACHED:
+                self.__ships.clear()
+            self.__ships[mask] = key
+        return key
+
+    @classmethod
+    def mix(cls, key):
+#       the finalizer of splitmix64
+        key = (key ^ (key >> 30)) * 0xBF58476D1CE4E5B9 & cls.MASK
+        key = (key ^ (key >> 27)) * 0x94D049BB133111EB & cls.MASK
+        return key ^ (key >> 31)
+
+    def layout(self, layout):
+        key = self.__layouts.get(layout)
+        if key is None:
+            key = self.mix(sum(self.mix(self.ship(ship)) for ship in layout) & self.MASK)
+            if len(self.__layouts) >= self.MAX_CACHED:
+                self.__layouts.clear()
+            self.__layouts[layout] = key
+        return key
+
+    def position(self, layouts):
+        key = 0
+        for layout in layouts:
+            key ^= self.layout(layout)
+        return key
+
+
+SHARED_KEYS = ZobristKeys()
+
+
+def get_remaining_fleet(board, fleet=FLEET):
+    remaining = Counter(fleet)
+    for ship in board.ships:
+        if ship.lives == 0:
+            remaining[ship.length] -= 1
+    return sorted(remaining.elements(), reverse=True)
+
+
+def get_layouts(board, lengths, limit, node_limit=None):
+#   the placements of the ships left on the free and the hit cells, not touching each other and covering
+#   all the hits, every layout is a frozenset of the masks of its cells not shot yet;
+#   None if there are more than limit of them
+    hits = board.get_masks()[HIT_ST]
+    allowed = board.get_free_mask() | hits
+    unavailable = ~allowed & ((1 << board.width * board.height) - 1)
+    width = board.width
+    placements = {}
+    for length in set(lengths):
+        options = []
+        for orientation, starts in zip((True, False), board.get_start_masks(length, unavailable)):
+            step = 1 if orientation else width
+            for start in Board.iter_set_bits(starts):
+                cells = 0
+                for i in range(length):
+                    cells |= 1 << (start + i * step)
+#               a ship on the hits only would have been killed already
+                if not cells & ~hits:
+                    continue
+                options.append((start, cells, board.get_area_mask(start, length, orientation)))
+        placements[length] = sorted(options, key=lambda option: option[0])
+    node_limit = limit * 64 if node_limit is None else node_limit
+    layouts = set()
+    nodes = 0
+    stack = [(0, 0, 0, 0, ())]
+    while stack:
+        index, first, blocked, covered, ships = stack.pop()
+        nodes += 1
+        if nodes > node_limit:
+            return None
+        if index == len(lengths):
+            if not hits & ~covered:
+                layouts.add(frozenset(ship & ~hits for ship in ships if ship & ~hits))
+                if len(layouts) > limit:
+                    return None
+            continue
+        length = lengths[index]
+#       the ships of the same length are placed in the order of their starts, so a layout is found once
+        options = placements[length]
+        start = first if index and lengths[index - 1] == length else 0
+        for number in range(start, len(options)):
+            _, cells, area = options[number]
+            if not cells & blocked:
+                stack.append((index + 1, number + 1, blocked | area, covered | cells, ships + (cells,)))
+    return layouts
+
+
+class EndgameSolver:
+#   an exact search of the shots taking the fewest shots on average to sink the ships left, every layout
+#   of them is taken as equally likely; it is only run when the layouts are few
+    MAX_SHIPS = 3
+    MAX_LAYOUTS = 24
+    MAX_NODES = 1000
+#   the placements are listed over the whole board, with more free cells there are too many layouts anyway
+    MAX_FREE = 64
+
+    def __init__(self, table=None, keys=None):
+        self.table = table if table is not None else SHARED_TABLE
+        self.keys = keys if keys is not None else SHARED_KEYS
+        self.__nodes = 0
+#       perf_counter() time the search has to stop by, None - no limit
+        self.__deadline = None
+
+    def get_layouts(self, board, fleet=FLEET):
+        lengths = get_remaining_fleet(board, fleet)
+        if not lengths or len(lengths) > self.MAX_SHIPS or board.get_free_count() > self.MAX_FREE:
+            return None
+        return get_layouts(board, lengths, self.MAX_LAYOUTS)
+
+    def best_shot(self, board, fleet=FLEET, deadline=None):
+#       the dot to shoot at or None if the position is not an endgame or its search is over the budget
+        layouts = self.get_layouts(board, fleet)
+        if not layouts:
+            return None
+        self.__nodes = 0
+        self.__deadline = deadline
+        try:
+            _, cell = self.solve(list(layouts))
+        except EndgameBudgetException:
+            return None
+        return Dot(*divmod(cell, board.width)) if cell is not None else None
+
+    def expected_shots(self, board, fleet=FLEET):
+        layouts = self.get_layouts(board, fleet)
+        if not layouts:
+            return None
+        self.__nodes = 0
+        self.__deadline = None
+        return self.solve(list(layouts))[0]
+
+    @staticmethod
+    def shoot(layout, bit):
+        for ship in layout:
+            if ship & bit:
+                rest = ship ^ bit
+                if rest:
+                    return HIT, layout - {ship} | {rest}
+                return KILL, layout - {ship}
+        return MISS, layout
+
+    def solve(self, layouts):
+#       returns (expected number of shots, cell to shoot) of the equally likely layouts
+        key = self.keys.position(layouts)
+        entry = self.table.get(key)
+        if entry is not None:
+            return entry
+        counts = Counter()
+        for layout in layouts:
+            for ship in layout:
+                counts.update(Board.iter_set_bits(ship))
+        if not counts:
+            return 0.0, None
+        self.__nodes += 1
+        if self.__nodes > self.MAX_NODES or self.__deadline is not None and perf_counter() >= self.__deadline:
+            raise EndgameBudgetException
+        total = len(layouts)
+        best = None
+#       the cells taken in the most layouts go first, they give the best bound to cut the others with
+        for cell, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0])):
+            bit = 1 << cell
+            outcomes = {}
+            for layout in layouts:
+                result, child = self.shoot(layout, bit)
+                outcomes.setdefault(result, []).append(child)
+            expected = 1.0
+            for children in outcomes.values():
+                expected += len(children) / total * self.solve(children)[0]
+                if best is not None and expected >= best[0]:
+                    break
+            if best is None or expected < best[0]:
+                best = (expected, cell)
+        self.table.put(key, best)
+        return best
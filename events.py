@@ -0,0 +1,132 @@
+from collections import namedtuple
+
+# player is 1 for the user and 2 for the AI, the same as in the move log and Game.turn_hooks,
+# game_id tells the games apart when the events of many games go to the same consumers
+# ships - (length, x, y, horizontal) of every ship placed
+PlacementEvent = namedtuple('PlacementEvent', ['game_id', 'player', 'ships'])
+# the shot before the enemy board answers it
+ShotEvent = namedtuple('ShotEvent', ['game_id', 'player', 'x', 'y'])
+# result - one of the *_ST statuses, OUT_ST and OCCUPIED_ST included, the shot is asked again after them
+ResultEvent = namedtuple('ResultEvent', ['game_id', 'player', 'x', 'y', 'result'])
+# the ship of the enemy killed by the player
+KillEvent = namedtuple('KillEvent', ['game_id', 'player', 'length', 'x', 'y', 'horizontal'])
+GameOverEvent = namedtuple('GameOverEvent', ['game_id', 'winner', 'turns'])
+
+EVENT_TYPES = {event_type.__name__: event_type
+               for event_type in (PlacementEvent, ShotEvent, ResultEvent, KillEvent, GameOverEvent)}
+# the game module imports this one, so asyncio and json are imported only by the consumers that use them
+
+
+class EventQueue:
+#   the events for a consumer running in its own task, read by async for, the game waits while the queue is full,
+#   so a slow consumer holds its game back instead of the events piling up in memory
+    def __init__(self, maxsize=256):
+        import asyncio
+        self.queue = asyncio.Queue(maxsize)
+        self.closed = False
+#       the events the synchronous EventHub.publish found no room for
+        self.dropped = 0
+
+    async def put(self, event):
+        await self.queue.put(event)
+
+    def put_nowait(self, event):
+#       the games driven without the event loop can't wait, the event is dropped if the queue is full
+        if self.queue.full():
+            self.dropped += 1
+        else:
+            self.queue.put_nowait(event)
+
+    async def close(self):
+        if not self.closed:
+            self.closed = True
+            await self.queue.put(None)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.queue.get()
+        if event is None:
+            raise StopAsyncIteration
+        return event
+
+
+class EventHub:
+#   every event goes to all the consumers once: the callables get it right away in the driver of the game,
+#   the queues of the async consumers get it with the backpressure of their size from publish_async, and
+#   dropped when they are full from publish, see EventQueue.dropped
+    def __init__(self, consumers=()):
+        self.consumers = list(consumers)
+        self.queues = []
+
+    def subscribe(self, consumer):
+        self.consumers.append(consumer)
+        return consumer
+
+    def unsubscribe(self, consumer):
+        self.consumers.remove(consumer)
+
+    def stream(self, maxsize=256):
+        queue = EventQueue(maxsize)
+        self.queues.append(queue)
+        return queue
+
+    def publish(self, event):
+        for consumer in self.consumers:
+            consumer(event)
+        for queue in self.queues:
+            queue.put_nowait(event)
+
+    async def publish_async(self, event):
+        for consumer in self.consumers:
+            consumer(event)
+        for queue in self.queues:
+            await queue.put(event)
+
+    async def close(self):
+        for queue in self.queues:
+            await queue.close()
+        self.queues = []
+
+
+class JsonLinesWriter:
+#   an event consumer writing every event as a JSON line, {"event": type name, the fields of the event}
+    def __init__(self, stream):
+        import json
+        self.dumps = json.dumps
+        self.stream = stream
+
+    def __call__(self, event):
+        record = {'event': type(event).__name__}
+        record.update(event._asdict())
+        self.stream.write(self.dumps(record, ensure_ascii=False) + "\n")
+
+
+def read_event(line):
+    import json
+    record = json.loads(line)
+    event_type = EVENT_TYPES[record.pop('event')]
+    if event_type is PlacementEvent:
+        record['ships'] = tuple(tuple(ship) for ship in record['ships'])
+    return event_type(**record)
+
+
+def iter_events(steps, answer=input):
+#   drives the steps of a game and yields its events only, the output is dropped and the boards are not even
+#   formatted, the questions are answered by answer(prompt), the AI is called in place
+    from game_classes import CALL_REQ, EVENT_REQ, INPUT_REQ
+
+    reply = None
+    while True:
+        try:
+            request, payload = steps.send(reply)
+        except StopIteration:
+            return
+        reply = None
+        if request == EVENT_REQ:
+            yield payload
+        elif request == INPUT_REQ:
+            reply = answer(payload)
+        elif request == CALL_REQ:
+            reply = payload()
@@ -1,6 +1,14 @@
-from random import randint
+import struct
+from bisect import bisect_right
+from itertools import accumulate
+from math import isnan
+from random import Random
+from time import perf_counter
+
+from events import GameOverEvent, KillEvent, PlacementEvent, ResultEvent, ShotEvent
 
 BOARD_SIZE = 6
+FLEET = (3, 2, 2, 1, 1, 1, 1)
 SHIP_ST = 'ship'
 MISS_ST = 'miss'
 HIT_ST = 'hit'
@@ -10,6 +18,62 @@ OUT_ST = 'out of board'
 LOOSE_ST = 'loose'
 OCCUPIED_ST = 'occupied'
 LAST_SYM_ST = 'last'
+# requests yielded by the *_steps generators to the code driving the game:
+# INPUT_REQ - the text typed after the prompt is sent back, OUTPUT_REQ - the text is shown to the user,
+# CALL_REQ - the function is called (maybe in a worker) and its result is sent back,
+# EVENT_REQ - an event of events.py for the consumers of the game, nothing is sent back,
+# RENDER_REQ - the text the function returns is shown to the user, the drivers dropping the output don't call it
+INPUT_REQ = 'input'
+OUTPUT_REQ = 'output'
+CALL_REQ = 'call'
+EVENT_REQ = 'event'
+RENDER_REQ = 'render'
+SNAPSHOT_MAGIC = b'BSHP'
+SNAPSHOT_VERSION = 3
+
+
+def strip_colors(text):
+#   drops the colour and the style escape codes, ESC [ digits and semicolons m, of the text
+    parts = text.split("\033[")
+    for number in range(1, len(parts)):
+        part = parts[number]
+        end = 0
+        while end < len(part) and part[end] in "0123456789;":
+            end += 1
+        if end < len(part) and part[end] == 'm':
+            parts[number] = part[end + 1:]
+        else:
+            parts[number] = "\033[" + part
+    return ''.join(parts)
+
+
+def split_rng(rng, streams):
+#   independent generators seeded from the parent one, so the seed of the parent determines all of them
+    return [Random(rng.getrandbits(64)) for _ in range(streams)]
+
+
+def run_steps(steps, on_event=None):
+#   on_event(event) gets the events of the game, events.EventHub.publish for many consumers
+    reply = None
+    while True:
+        try:
+            request, payload = steps.send(reply)
+        except StopIteration as stop:
+            return stop.value
+        if request == INPUT_REQ:
+            reply = input(payload)
+        elif request == OUTPUT_REQ:
+            print(payload)
+            reply = None
+        elif request == RENDER_REQ:
+            print(payload())
+            reply = None
+        elif request == EVENT_REQ:
+            if on_event is not None:
+                on_event(payload)
+            reply = None
+        else:
+            reply = payload()
 
 
 class BoardOutException(Exception):
@@ -32,26 +96,49 @@ class ShipWrongPosition(Exception):
         Exception.__init__(self, args)
 
 
+class SnapshotException(Exception):
+    def __init__(self, args="The game snapshot is broken or has an unknown version!"):
+        Exception.__init__(self, args)
+
+
 class Dot:
-    def __init__(self, x, y):
-        self.x_coord = self.__test_value(x)
-        self.y_coord = self.__test_value(y)
+    __slots__ = ('__x', '__y', '__hash')
+    __cache = {}
+    __interned_sizes = set()
+#   the dots of the larger boards are created when needed
+    INTERN_LIMIT = 130 * 130
+
+    def __new__(cls, x, y):
+        if type(x) is not int or type(y) is not int:
+            x, y = cls.__test_value(x), cls.__test_value(y)
+        dot = cls.__cache.get((x, y))
+        if dot is None:
+            dot = object.__new__(cls)
+            object.__setattr__(dot, '_Dot__x', x)
+            object.__setattr__(dot, '_Dot__y', y)
+            object.__setattr__(dot, '_Dot__hash', hash((x, y)))
+        return dot
+
+    @classmethod
+    def intern(cls, board_size, height=None):
+#       caches the dots of the board together with the one cell wide frame around it,
+#       so Ship.area() and Ship.get_edges() don't create new objects either
+        height = board_size if height is None else height
+        if (board_size, height) not in cls.__interned_sizes and \
+                (board_size + 2) * (height + 2) <= cls.INTERN_LIMIT:
+            for x in range(-1, height + 1):
+                for y in range(-1, board_size + 1):
+                    if (x, y) not in cls.__cache:
+                        cls.__cache[(x, y)] = cls(x, y)
+            cls.__interned_sizes.add((board_size, height))
 
     @property
     def x(self):
-        return self.x_coord
-
-    @x.setter
-    def x(self, value):
-        self.x_coord = self.__test_value(value)
+        return self.__x
 
     @property
     def y(self):
-        return self.y_coord
-
-    @y.setter
-    def y(self, value):
-        self.y_coord = self.__test_value(value)
+        return self.__y
 
     @staticmethod
     def __test_value(value):
@@ -60,14 +147,29 @@ class Dot:
         else:
             raise TypeError("Coordinates must be an integer")
 
+    def __setattr__(self, key, value):
+        raise AttributeError("Dot is immutable")
+
+    def __delattr__(self, item):
+        raise AttributeError("Dot is immutable")
+
+    def __reduce__(self):
+        return Dot, (self.__x, self.__y)
+
     def __eq__(self, other):
         if isinstance(other, Dot):
-            return (self.x_coord == other.x) and (self.y_coord == other.y)
+            return (self.__x == other.x) and (self.__y == other.y)
         elif isinstance(other, (tuple, list)) and len(other) == 2 and all(isinstance(_, int) for _ in other):
-            return (self.x_coord == other[0]) and (self.y_coord == other[1])
+            return (self.__x == other[0]) and (self.__y == other[1])
         else:
             return False
 
+    def __hash__(self):
+        return self.__hash
+
+    def __repr__(self):
+        return f"Dot({self.__x}, {self.__y})"
+
     def __len__(self):
         return 1
 
@@ -79,6 +181,14 @@ class Ship:
 #       orientation: True - horizontal, False - vertical
         self.__orientation = orientation
         self.__lives = length
+        self.__reset_cache()
+
+    def __reset_cache(self):
+#       dots, cells, area and edges depend only on length, start point and orientation
+        self.__dots = None
+        self.__cells = None
+        self.__area = None
+        self.__edges = None
 
     @property
     def length(self):
@@ -89,6 +199,7 @@ class Ship:
         if ship_length < self.__lives:
             self.__lives = ship_length
         self.__length = ship_length
+        self.__reset_cache()
 
     @property
     def start_point(self):
@@ -97,6 +208,7 @@ class Ship:
     @start_point.setter
     def start_point(self, dot):
         self.__start_point = dot
+        self.__reset_cache()
 
     @property
     def orientation(self):
@@ -105,6 +217,7 @@ class Ship:
     @orientation.setter
     def orientation(self, ship_orientation):
         self.__orientation = ship_orientation
+        self.__reset_cache()
 
     @property
     def lives(self):
@@ -120,25 +233,42 @@ class Ship:
             raise ShipLivesException
 
     def dots(self):
-        if self.__orientation:
-            return [Dot(self.__start_point.x, i) for i in
-                    range(self.__start_point.y, self.__start_point.y + self.__length)]
-        else:
-            return [Dot(i, self.__start_point.y) for i in
-                    range(self.__start_point.x, self.__start_point.x + self.__length)]
+        if self.__dots is None:
+            if self.__orientation:
+                self.__dots = tuple(Dot(self.__start_point.x, i) for i in
+                                    range(self.__start_point.y, self.__start_point.y + self.__length))
+            else:
+                self.__dots = tuple(Dot(i, self.__start_point.y) for i in
+                                    range(self.__start_point.x, self.__start_point.x + self.__length))
+        return self.__dots
+
+    def cells(self):
+        if self.__cells is None:
+            self.__cells = frozenset(self.dots())
+        return self.__cells
 
     def area(self):
-        area = []
+        if self.__area is None:
+            self.__area = self.__get_area()
+        return self.__area
+
+    def __get_area(self):
+        area = set()
         for i in range(self.__start_point.x - 1,
                        self.__start_point.x + 2 if self.__orientation
                        else self.__start_point.x + self.__length + 1):
             for j in range(self.__start_point.y - 1,
                            self.__start_point.y + self.__length + 1 if self.__orientation
                            else self.__start_point.y + 2):
-                area.append(Dot(i, j))
-        return area
+                area.add(Dot(i, j))
+        return frozenset(area)
 
     def get_edges(self):
+        if self.__edges is None:
+            self.__edges = self.__get_edges()
+        return self.__edges
+
+    def __get_edges(self):
         dots = []
         if self.__length == 1:
             dots.append(Dot(self.__start_point.x-1, self.__start_point.y))
@@ -152,36 +282,191 @@ class Ship:
             else:
                 dots.append(Dot(self.__start_point.x-1, self.__start_point.y))
                 dots.append(Dot(self.__start_point.x+self.__length, self.__start_point.y))
-        return dots
+        return tuple(dots)
+
+
+class BoardView:
+    def __init__(self):
+        self.ship_symbol = "\033[37mH\033[0m"
+        self.miss_symbol = "\033[34m-\033[0m"
+        self.hit_symbol = "\033[33m\033[1mX\033[0m"
+        self.kill_symbol = "\033[41m\033[30m\033[1mX\033[0m"
+        self.blank_symbol = " \033[0m"
+        self.last_turn_symbol = "\033[7m"
+
+    def get_symbols(self):
+        return {
+            SHIP_ST: self.ship_symbol,
+            MISS_ST: self.miss_symbol,
+            HIT_ST: self.hit_symbol,
+            KILL_ST: self.kill_symbol,
+            BLANK_ST: self.blank_symbol,
+            LAST_SYM_ST: self.last_turn_symbol,
+        }
+
+    def cell(self, board, dot):
+        state = board.get_state(dot)
+        if state == BLANK_ST:
+            return self.blank_symbol
+        elif state == SHIP_ST:
+            return self.blank_symbol if board.hid else self.ship_symbol
+        symbol = self.get_symbols()[state]
+        if dot == board.get_last_turn():
+            return self.last_turn_symbol + symbol
+        return symbol
+
+    def row(self, board, x):
+#       the symbols of the row x, only the cells with a shot or a ship shown are looked at one by one
+        masks = board.get_row(x)
+        shown = masks[MISS_ST] | masks[HIT_ST] | masks[KILL_ST] | (0 if board.hid else masks[SHIP_ST])
+        symbols = [self.blank_symbol] * board.width
+        for y in Board.iter_set_bits(shown):
+            symbols[y] = self.cell(board, Dot(x, y))
+        return symbols
+
+
+class PlainBoardView(BoardView):
+#   the symbols with no escape codes for the output that is not a terminal, the last turn is not marked
+    def __init__(self):
+        BoardView.__init__(self)
+        self.ship_symbol = "H"
+        self.miss_symbol = "-"
+        self.hit_symbol = "x"
+        self.kill_symbol = "X"
+        self.blank_symbol = " "
+        self.last_turn_symbol = ""
+
+
+class RowMask:
+#   cells of the board kept as row number -> bits of the row, cell (x, y) is bit y of row x; the empty rows
+#   are not kept, so the memory and the time of the operations follow the rows in use and not the board area
+    __slots__ = ('rows',)
+
+    def __init__(self, rows=None):
+        self.rows = {} if rows is None else rows
+
+    @classmethod
+    def from_int(cls, mask, width):
+        rows = {}
+        row_mask = (1 << width) - 1
+        x = 0
+        while mask:
+#           the empty rows up to the next set bit are skipped at once
+            skip = ((mask & -mask).bit_length() - 1) // width
+            mask >>= skip * width
+            x += skip
+            rows[x] = mask & row_mask
+            mask >>= width
+            x += 1
+        return cls(rows)
+
+    def to_int(self, width):
+        mask = 0
+        for x, row in self.rows.items():
+            mask |= row << (x * width)
+        return mask
+
+    def __bool__(self):
+        return bool(self.rows)
+
+    def test(self, x, y):
+        return self.rows.get(x, 0) >> y & 1
+
+    def add(self, x, y):
+        self.rows[x] = self.rows.get(x, 0) | (1 << y)
+
+    def update(self, other):
+        rows = self.rows
+        for x, row in other.rows.items():
+            rows[x] = rows.get(x, 0) | row
+
+    def difference_update(self, other):
+        rows = self.rows
+        for x, row in other.rows.items():
+            if x in rows:
+                row = rows[x] & ~row
+                if row:
+                    rows[x] = row
+                else:
+                    del rows[x]
+
+    def difference(self, other):
+        rows = {}
+        for x, row in self.rows.items():
+            row &= ~other.rows.get(x, 0)
+            if row:
+                rows[x] = row
+        return RowMask(rows)
+
+    def intersects(self, other):
+#       goes over the rows of this mask, the smaller one is better put first
+        rows = other.rows
+        for x, row in self.rows.items():
+            if row & rows.get(x, 0):
+                return True
+        return False
+
+    def count(self):
+        return sum(row.bit_count() for row in self.rows.values())
+
+    def copy(self):
+        return RowMask(dict(self.rows))
 
 
 class Board:
-    def __init__(self, board_size=BOARD_SIZE):
-        self.__ship_symbol = "\033[37mH\033[0m"
-        self.__miss_symbol = "\033[34m-\033[0m"
-        self.__hit_symbol = "\033[33m\033[1mX\033[0m"
-        self.__kill_symbol = "\033[41m\033[30m\033[1mX\033[0m"
-        self.__blank_symbol = " \033[0m"
-        self.__last_turn_symbol = "\033[7m"
+#   (width, height, length) -> masks of the cells a horizontal and a vertical ship of this length may start from,
+#   (width, height) -> the top left cells of the 2x2 blocks the board is cut into; they only depend on the size,
+#   so the boards of one size share them and a board keeps no mask of its whole area
+    __start_limits = {}
+    __block_corners = {}
+
+    def __init__(self, board_size=BOARD_SIZE, height=None, rng=None):
+#       board_size is the number of columns (y), height is the number of rows (x), the board is square by default
+        self.__width = board_size
+#       random.Random for the random free cells, the boards of a player share the player's one
+        self.rng = rng if rng is not None else Random()
+        self.__height = board_size if height is None else height
+        Dot.intern(self.__width, self.__height)
         self.__last_turn = None
-        self.__enum_symbol = {
-            self.__miss_symbol: MISS_ST,
-            self.__hit_symbol: HIT_ST,
-            self.__kill_symbol: KILL_ST,
-            }
-        self.__enum_status = {
-            MISS_ST: self.__miss_symbol,
-            HIT_ST: self.__hit_symbol,
-            KILL_ST: self.__kill_symbol,
-            }
-        self.board = [[self.__blank_symbol] * board_size for _ in range(board_size)]
+#       the masks are kept as RowMask, only the rows with the shots, the ships and their areas take memory;
+#       the mask methods below give the whole board masks, cell (x, y) is the bit number x * width + y of them
+        self.__ships_mask = RowMask()
+        self.__miss_mask = RowMask()
+        self.__hit_mask = RowMask()
+        self.__kill_mask = RowMask()
+        self.__shot_mask = RowMask()
+#       cells taken by the ships together with their areas, no other ship may be placed here
+        self.__halo_mask = RowMask()
+#       the cells shot or in the area of a dead ship, all the other cells are free
+        self.__blocked_mask = RowMask()
+        self.__free_count = self.__width * self.__height
+#       the number of the free cells of every row, the rank of a free cell is found in their running sums
+        self.__row_free = [self.__width] * self.__height
+        self.view = BoardView()
         self.ships = []
+#       ship -> its index in ships, a ship is taken out of the list by moving the last one in its place
+        self.__ship_index = {}
+#       cell -> ship, on the tracking board every run of hits is indexed as one ship, so a new hit is joined
+#       with the runs at its ends with no scan over the ships
+        self.__ship_at = {}
+#       ship -> masks of its cells and of its area
+        self.__ship_masks = {}
+#       the ships with lives left, in the order they were added
+        self.__alive = {}
         self.hid = True
         self.alive_ships = 0
 
     @property
     def board_size(self):
-        return len(self.board)
+        return self.__width
+
+    @property
+    def width(self):
+        return self.__width
+
+    @property
+    def height(self):
+        return self.__height
 
     @property
     def hid_ships(self):
@@ -197,50 +482,197 @@ class Board:
     def get_last_turn(self):
         return self.__last_turn
 
+    def get_ship(self, dot):
+        return self.__ship_at.get(dot)
+
     def get_symbols(self):
+        return self.view.get_symbols()
+
+    def get_masks(self):
+        width = self.__width
         return {
-            SHIP_ST: self.__ship_symbol,
-            MISS_ST: self.__miss_symbol,
-            HIT_ST: self.__hit_symbol,
-            KILL_ST: self.__kill_symbol,
-            BLANK_ST: self.__blank_symbol,
-            LAST_SYM_ST: self.__last_turn_symbol,
+            SHIP_ST: self.__ships_mask.to_int(width),
+            MISS_ST: self.__miss_mask.to_int(width),
+            HIT_ST: self.__hit_mask.to_int(width),
+            KILL_ST: self.__kill_mask.to_int(width),
         }
 
+    def get_row_masks(self):
+#       the masks of get_masks as row number -> bits of the row, with no empty rows
+        return {
+            SHIP_ST: dict(self.__ships_mask.rows),
+            MISS_ST: dict(self.__miss_mask.rows),
+            HIT_ST: dict(self.__hit_mask.rows),
+            KILL_ST: dict(self.__kill_mask.rows),
+        }
+
+    def get_row(self, x):
+#       the bits of the row x of every mask of get_masks
+        return {
+            SHIP_ST: self.__ships_mask.rows.get(x, 0),
+            MISS_ST: self.__miss_mask.rows.get(x, 0),
+            HIT_ST: self.__hit_mask.rows.get(x, 0),
+            KILL_ST: self.__kill_mask.rows.get(x, 0),
+        }
+
+    def get_state(self, dot):
+        x, y = dot.x, dot.y
+        if self.__kill_mask.test(x, y):
+            return KILL_ST
+        elif self.__hit_mask.test(x, y):
+            return HIT_ST
+        elif self.__miss_mask.test(x, y):
+            return MISS_ST
+        elif self.__ships_mask.test(x, y):
+            return SHIP_ST
+        return BLANK_ST
+
+    def is_shot(self, dot):
+        return bool(self.__shot_mask.rows.get(dot.x, 0) >> dot.y & 1)
+
+    def __dots_mask(self, dots):
+        rows = {}
+        width, height = self.__width, self.__height
+        for dot in dots:
+            x, y = dot.x, dot.y
+            if 0 <= x < height and 0 <= y < width:
+                rows[x] = rows.get(x, 0) | (1 << y)
+        return RowMask(rows)
+
+    def __full_mask(self):
+        return (1 << self.__width * self.__height) - 1
+
+    def __block_cell(self, x, y):
+#       __block_mask of one cell, true if the cell was free until now
+        rows = self.__blocked_mask.rows
+        row = rows.get(x, 0)
+        if row >> y & 1:
+            return False
+        rows[x] = row | (1 << y)
+        self.__free_count -= 1
+        self.__row_free[x] -= 1
+        return True
+
+    def __block_mask(self, mask):
+#       returns the cells of the mask that were free until now
+        mask = mask.difference(self.__blocked_mask)
+        if mask:
+            self.__blocked_mask.update(mask)
+            for x, row in mask.rows.items():
+                count = row.bit_count()
+                self.__free_count -= count
+                self.__row_free[x] -= count
+        return mask
+
+    def __reset_free_cells(self):
+        self.__blocked_mask = self.__shot_mask.copy()
+        self.__free_count = self.__width * self.__height - self.__shot_mask.count()
+        self.__row_free = [self.__width] * self.__height
+        for x, row in self.__shot_mask.rows.items():
+            self.__row_free[x] -= row.bit_count()
+
+    @staticmethod
+    def iter_set_bits(mask):
+#       the set bits are found in the binary string, so the cost is linear in the mask length
+        bits = bin(mask)[:1:-1]
+        bit = bits.find('1')
+        while bit >= 0:
+            yield bit
+            bit = bits.find('1', bit + 1)
+
+    def __mark_killed(self, ship):
+        cells, halo = self.__ship_masks[ship]
+        self.__hit_mask.difference_update(cells)
+        self.__kill_mask.update(cells)
+        self.__shot_mask.update(cells)
+        self.__alive.pop(ship, None)
+        return self.__block_mask(halo)
+
+    def __block_wounded(self, ship):
+#       no other ship touches a run of hits, only its edges may hide the rest of its decks
+        cells, halo = self.__ship_masks[ship]
+        area = halo.difference(cells)
+        area.difference_update(self.__dots_mask(ship.get_edges()))
+        return self.__block_mask(area)
+
     def get_dead_ships_area(self):
-        area = []
+        area = set()
         for ship in self.ships:
             if ship.lives == 0:
-                for dot in ship.area():
-                    area.append(dot)
+                area.update(ship.area())
         return area
 
     def get_ships_edges(self):
         edges = []
-        for ship in self.ships:
+        for ship in self.__alive:
             if ship.lives > 0:
                 for edge in ship.get_edges():
                     if not self.out(edge):
-                        if self.board[edge.x][edge.y] == self.__blank_symbol:
+                        if not self.__shot_mask.rows.get(edge.x, 0) >> edge.y & 1:
                             edges.append(edge)
         return edges
 
+    def get_free_mask(self):
+        return self.__full_mask() & ~self.__blocked_mask.to_int(self.__width)
+
     def get_free_dots(self):
+        return [Dot(*divmod(cell, self.__width)) for cell in self.iter_set_bits(self.get_free_mask())]
+
+    def get_free_count(self):
+        return self.__free_count
+
+    def get_random_free_dot(self):
+        if not self.__free_count:
+            return None
+        cells = self.__width * self.__height
+        if self.__free_count * 2 >= cells:
+#           at least half of the board is free, on average two random tries find a free cell
+            rows = self.__blocked_mask.rows
+            x, y = divmod(self.rng.randrange(cells), self.__width)
+            while rows.get(x, 0) >> y & 1:
+                x, y = divmod(self.rng.randrange(cells), self.__width)
+            return Dot(x, y)
+        return self.__nth_free_dots([self.rng.randrange(self.__free_count)])[0]
+
+    def __nth_free_dots(self, ranks):
+#       the free dots of the ranks in the order of the cells, the row of a rank is bisected in the running sums
+#       of the free cells of the rows
+        full_row = (1 << self.__width) - 1
+        blocked = self.__blocked_mask.rows
+        row_free = self.__row_free
+        ends = list(accumulate(row_free))
         dots = []
-        for x in range(0, self.board_size):
-            for y in range(0, self.board_size):
-                if ((x, y) not in self.get_dead_ships_area()) and (self.board[x][y] == self.__blank_symbol):
-                    dots.append(Dot(x, y))
+        for rank in sorted(ranks):
+            x = bisect_right(ends, rank)
+            row = full_row & ~blocked.get(x, 0)
+            dots.append(Dot(x, self.nth_set_bit(row, rank - ends[x] + row_free[x])))
         return dots
 
+    def sample_free_dots(self, count):
+#       up to count different free dots in a random order, the ranks of all of them are drawn at once
+#       and found in one pass over the free cells
+        ranks = self.rng.sample(range(self.__free_count), min(count, self.__free_count))
+        dots = dict(zip(sorted(ranks), self.__nth_free_dots(ranks)))
+        return [dots[rank] for rank in ranks]
+
+    def is_free(self, dot):
+        return not self.__blocked_mask.rows.get(dot.x, 0) >> dot.y & 1
+
     def add_ship(self, ship):
         if isinstance(ship, Ship):
             if not any(map(self.out, ship.dots())):
-                for current_ship in self.ships:
-                    for ship_dot in ship.dots():
-                        if ship_dot in current_ship.area():
-                            raise ShipWrongPosition
-                self.ships.append(ship)
+                cells = self.__dots_mask(ship.dots())
+                if cells.intersects(self.__halo_mask):
+                    raise ShipWrongPosition
+                self.__index_ship(ship)
+                for dot in ship.dots():
+                    self.__ship_at[dot] = ship
+                halo = self.__dots_mask(ship.area())
+                self.__ship_masks[ship] = (cells, halo)
+                self.__ships_mask.update(cells)
+                self.__halo_mask.update(halo)
+                if ship.lives == 0:
+                    self.__block_mask(halo)
                 self.alive_ships += 1
             else:
                 raise BoardOutException
@@ -250,67 +682,276 @@ class Board:
     def try_ship(self, ship):
         if isinstance(ship, Ship):
             if not any(map(self.out, ship.dots())):
-                for current_ship in self.ships:
-                    for ship_dot in ship.dots():
-                        if ship_dot in current_ship.area():
-                            return False
+                if self.__dots_mask(ship.dots()).intersects(self.__halo_mask):
+                    return False
             else:
                 return False
         else:
             raise TypeError("Ship to add must be the Ship class object")
         return True
 
+    def __index_ship(self, ship):
+        self.__ship_index[ship] = len(self.ships)
+        self.ships.append(ship)
+        if ship.lives > 0:
+            self.__alive[ship] = None
+
+    def __unindex_ship(self, ship):
+        index = self.__ship_index.pop(ship)
+        last = self.ships.pop()
+        if last is not ship:
+            self.ships[index] = last
+            self.__ship_index[last] = index
+        self.__alive.pop(ship, None)
+        if ship.lives > 0:
+            self.alive_ships -= 1
+
+    def remove_ship(self, ship):
+        self.__unindex_ship(ship)
+        for dot in ship.dots():
+            if self.__ship_at.get(dot) is ship:
+                del self.__ship_at[dot]
+        del self.__ship_masks[ship]
+        self.__ships_mask = RowMask()
+        self.__halo_mask = RowMask()
+        for cells, halo in self.__ship_masks.values():
+            self.__ships_mask.update(cells)
+            self.__halo_mask.update(halo)
+
+    def __get_start_limits(self, length):
+        key = (self.__width, self.__height, length)
+        limits = self.__start_limits.get(key)
+        if limits is None:
+            starts = max(0, self.__width - length + 1)
+            horizontal = 0
+            for x in range(self.__height):
+                horizontal |= ((1 << starts) - 1) << (x * self.__width)
+            vertical = (1 << (max(0, self.__height - length + 1) * self.__width)) - 1
+            limits = self.__start_limits[key] = (horizontal, vertical)
+        return limits
+
+    def get_halo_mask(self):
+        return self.__halo_mask.to_int(self.__width)
+
+    def get_block_count(self, halo_mask=None):
+#       the number of 2x2 blocks with a free cell out of the halo, no two ships have cells in one block,
+#       so the ships still to place need ceil(length / 2) of them each
+        if halo_mask is None:
+            halo_mask = self.get_halo_mask()
+        width = self.__width
+        corners = self.__block_corners.get((width, self.__height))
+        if corners is None:
+            row = 0
+            for y in range(0, width, 2):
+                row |= 1 << y
+            corners = 0
+            for x in range(0, self.__height, 2):
+                corners |= row << (x * width)
+            self.__block_corners[(width, self.__height)] = corners
+        free = self.__full_mask() & ~halo_mask
+        free |= (free & ~self.__get_start_limits(width)[0]) >> 1
+        free |= free >> width
+        return (free & corners).bit_count()
+
+    def get_start_masks(self, length, halo_mask=None):
+#       returns masks of the cells a horizontal and a vertical ship of the length may start from,
+#       a one deck ship is always horizontal
+        if halo_mask is None:
+            halo_mask = self.get_halo_mask()
+        horizontal, vertical = self.__get_start_limits(length)
+        free = self.__full_mask() & ~halo_mask
+        for i in range(length):
+            horizontal &= free >> i
+            vertical &= free >> (i * self.__width)
+        if length == 1:
+            vertical = 0
+        return horizontal, vertical
+
+    def get_area_mask(self, start, length, orientation):
+        width = self.__width
+        if orientation:
+            cells = ((1 << length) - 1) << start
+        else:
+            cells = 0
+            for i in range(length):
+                cells |= 1 << (start + i * width)
+        full = self.__full_mask()
+        first_column = self.__get_start_limits(width)[0]
+        cells |= ((cells << 1) & ~first_column & full) | ((cells >> 1) & ~(first_column << (width - 1)))
+        cells |= (cells << width) | (cells >> width)
+        return cells & full
+
+    @staticmethod
+    def nth_set_bit(mask, index):
+        low, high = 0, mask.bit_length()
+        while low < high:
+            middle = (low + high) // 2
+            if (mask & ((2 << middle) - 1)).bit_count() > index:
+                high = middle
+            else:
+                low = middle + 1
+        return low
+
     def append_ship(self, ship_to_append):
         if isinstance(ship_to_append, Ship):
-            for ship in self.ships:
-                for dot in ship_to_append.dots():
-                    if dot in ship.area():
-                        if ship_to_append.start_point.x == ship.start_point.x:
-                            if ((ship.orientation and ship.length > 1) or (ship.length == 1))\
-                                or ((ship_to_append.orientation and ship_to_append.length > 1)
-                                    or (ship_to_append.length == 1)):
-                                if ship_to_append.start_point.y + 1 == ship.start_point.y:
-                                    ship_to_append.length += ship.length
-                                    ship_to_append.lives += ship.lives
-                                    ship_to_append.orientation = True
-                                    self.ships.remove(ship)
-                                    self.append_ship(ship_to_append)
-                                    return
-                                elif ship_to_append.start_point.y == ship.start_point.y + ship.length:
-                                    ship_to_append.start_point.y = ship.start_point.y
-                                    ship_to_append.length += ship.length
-                                    ship_to_append.lives += ship.lives
-                                    ship_to_append.orientation = True
-                                    self.ships.remove(ship)
-                                    self.append_ship(ship_to_append)
-                                    return
-                            else:
-                                ShipWrongPosition()
-                        elif ship_to_append.start_point.y == ship.start_point.y:
-                            if ((not ship.orientation and ship.length > 1) or (ship.length == 1)) \
-                                    or ((not ship_to_append.orientation and ship_to_append.length > 1)
-                                        or (ship_to_append.length == 1)):
-                                if ship_to_append.start_point.x + 1 == ship.start_point.x:
-                                    ship_to_append.length += ship.length
-                                    ship_to_append.orientation = False
-                                    self.ships.remove(ship)
-                                    self.append_ship(ship_to_append)
-                                    return
-                                elif ship_to_append.start_point.x == ship.start_point.x + ship.length:
-                                    ship_to_append.start_point.x = ship.start_point.x
-                                    ship_to_append.start_point.y = ship.start_point.y
-                                    ship_to_append.length += ship.length
-                                    ship_to_append.orientation = False
-                                    self.ships.remove(ship)
-                                    self.append_ship(ship_to_append)
-                                    return
-            self.add_ship(ship_to_append)
+            start, length = ship_to_append.start_point, ship_to_append.length
+#           the runs a ship may join lie at its ends in the same line, a run across the line can't be the same ship
+            parts = {}
+            for horizontal in (True, False):
+                if length > 1 and bool(ship_to_append.orientation) != horizontal:
+                    continue
+                if horizontal:
+                    ends = (Dot(start.x, start.y - 1), Dot(start.x, start.y + length))
+                else:
+                    ends = (Dot(start.x - 1, start.y), Dot(start.x + length, start.y))
+                for end in ends:
+                    ship = self.__ship_at.get(end)
+                    if ship is not None and (ship.length == 1 or bool(ship.orientation) == horizontal):
+                        parts.setdefault(horizontal, []).append(ship)
+            if len(parts) != 1:
+#               nothing to join, or runs in both directions and then add_ship reports the wrong position
+                self.add_ship(ship_to_append)
+                return
+            (horizontal, ships), = parts.items()
+#           the longest run takes the others in, so only the cells of the shorter ones change their ship
+            survivor = max(ships, key=lambda ship: ship.length)
+#           the masks of a ship are its own, they are joined in place
+            cells, halo = self.__ship_masks[survivor]
+            new_cells = self.__dots_mask(ship_to_append.dots())
+            cells.update(new_cells)
+            halo.update(self.__dots_mask(ship_to_append.area()))
+            first = start
+            total_length, total_lives = survivor.length + length, survivor.lives + ship_to_append.lives
+            for ship in ships:
+                if ship is survivor:
+                    continue
+                part_cells, part_halo = self.__ship_masks.pop(ship)
+                cells.update(part_cells)
+                halo.update(part_halo)
+                total_length += ship.length
+                total_lives += ship.lives
+                for dot in ship.dots():
+                    self.__ship_at[dot] = survivor
+                self.__unindex_ship(ship)
+            for dot in ship_to_append.dots():
+                self.__ship_at[dot] = survivor
+            for ship in ships:
+                if (ship.start_point.x, ship.start_point.y) < (first.x, first.y):
+                    first = ship.start_point
+            survivor.start_point = first
+            survivor.orientation = horizontal
+            survivor.length = total_length
+            survivor.lives = total_lives
+            if total_lives > 0 and survivor not in self.__alive:
+                self.__alive[survivor] = None
+                self.alive_ships += 1
+            self.__ship_masks[survivor] = (cells, halo)
+            self.__ships_mask.update(new_cells)
+            self.__halo_mask.update(halo)
         else:
             raise TypeError("ship_to_append must be Ship class object")
 
     def erase_ships(self):
         self.ships = []
+        self.__ship_index = {}
+        self.__ship_at = {}
+        self.__ship_masks = {}
+        self.__alive = {}
+        self.__ships_mask = RowMask()
+        self.__halo_mask = RowMask()
         self.alive_ships = 0
+        self.__reset_free_cells()
+
+#   hid, last turn x and y (-1 if none), alive ships, ships count; then the ship, miss, hit and kill masks
+#   and for every ship its start x and y, length, orientation and lives;
+#   a mask is the number of its rows and every row as its number and its bits, the snapshots before
+#   the version 3 have every mask as the bits of the whole board
+    SNAPSHOT_HEADER = struct.Struct('<BhhHH')
+    SNAPSHOT_SHIP = struct.Struct('<hhBBB')
+    SNAPSHOT_ROWS = struct.Struct('<I')
+    SNAPSHOT_ROW = struct.Struct('<H')
+
+    def dump(self):
+        row_size = (self.__width + 7) // 8
+        last_turn = self.__last_turn
+        data = [self.SNAPSHOT_HEADER.pack(self.hid, last_turn.x if last_turn else -1, last_turn.y if last_turn else -1,
+                                          self.alive_ships, len(self.ships))]
+        for mask in (self.__ships_mask, self.__miss_mask, self.__hit_mask, self.__kill_mask):
+            data.append(self.SNAPSHOT_ROWS.pack(len(mask.rows)))
+            for x in sorted(mask.rows):
+                data.append(self.SNAPSHOT_ROW.pack(x))
+                data.append(mask.rows[x].to_bytes(row_size, 'little'))
+        for ship in self.ships:
+            data.append(self.SNAPSHOT_SHIP.pack(ship.start_point.x, ship.start_point.y, ship.length,
+                                                bool(ship.orientation), ship.lives))
+        return b''.join(data)
+
+    def __load_rows(self, data, offset):
+        row_size = (self.__width + 7) // 8
+        full_row = (1 << self.__width) - 1
+        count, = self.SNAPSHOT_ROWS.unpack_from(data, offset)
+        offset += self.SNAPSHOT_ROWS.size
+        rows = {}
+        for _ in range(count):
+            x, = self.SNAPSHOT_ROW.unpack_from(data, offset)
+            offset += self.SNAPSHOT_ROW.size
+            if len(data) < offset + row_size:
+                raise SnapshotException("The board snapshot is cut off!")
+            if x >= self.__height:
+                raise SnapshotException("The board snapshot has a row out of the board!")
+            row = int.from_bytes(data[offset:offset + row_size], 'little') & full_row
+            offset += row_size
+            if row:
+                rows[x] = row
+        return RowMask(rows), offset
+
+    def load(self, data, offset=0, version=SNAPSHOT_VERSION):
+        mask_size = (self.__width * self.__height + 7) // 8
+        hid, last_x, last_y, alive_ships, ships_count = self.SNAPSHOT_HEADER.unpack_from(data, offset)
+        offset += self.SNAPSHOT_HEADER.size
+        self.erase_ships()
+        masks = []
+        for _ in range(4):
+            if version >= 3:
+                mask, offset = self.__load_rows(data, offset)
+            else:
+                if len(data) < offset + mask_size:
+                    raise SnapshotException("The board snapshot is cut off!")
+                mask = RowMask.from_int(int.from_bytes(data[offset:offset + mask_size], 'little') &
+                                        self.__full_mask(), self.__width)
+                offset += mask_size
+            masks.append(mask)
+        self.__ships_mask, self.__miss_mask, self.__hit_mask, self.__kill_mask = masks
+        self.__shot_mask = self.__miss_mask.copy()
+        self.__shot_mask.update(self.__hit_mask)
+        self.__shot_mask.update(self.__kill_mask)
+        self.__reset_free_cells()
+        self.__last_turn = Dot(last_x, last_y) if last_x >= 0 else None
+        self.hid = bool(hid)
+        for _ in range(ships_count):
+            x, y, length, orientation, lives = self.SNAPSHOT_SHIP.unpack_from(data, offset)
+            offset += self.SNAPSHOT_SHIP.size
+            ship = Ship(length, Dot(x, y), bool(orientation))
+            ship.lives = lives
+            self.__index_ship(ship)
+            for dot in ship.dots():
+                self.__ship_at[dot] = ship
+            self.__ship_masks[ship] = (self.__dots_mask(ship.dots()), self.__dots_mask(ship.area()))
+            self.__halo_mask.update(self.__ship_masks[ship][1])
+            if ship.lives == 0:
+                self.__block_mask(self.__ship_masks[ship][1])
+            elif not self.__ship_masks[ship][0].difference(self.__hit_mask):
+                self.__block_wounded(ship)
+        self.alive_ships = alive_ships
+        return offset
+
+    def count_layouts(self, fleet=FLEET):
+        from layouts import LayoutCounter
+        return LayoutCounter(self, fleet).count()
+
+    def sample_layout(self, fleet=FLEET):
+        from layouts import LayoutCounter
+        return LayoutCounter(self, fleet).sample()
 
     def __getitem__(self, item):
         if not isinstance(item, Dot):
@@ -319,24 +960,17 @@ class Board:
             else:
                 raise TypeError("Item must be (x,y) tuple where x and y is integer or Dot class")
         if not self.out(item):
-            if self.board[item.x][item.y] != self.__blank_symbol:
-                if item == self.__last_turn:
-                    return self.__last_turn_symbol+self.board[item.x][item.y]
-                return self.board[item.x][item.y]
-            else:
-                if self.hid:
-                    return self.board[item.x][item.y]
-                else:
-                    for ship in self.ships:
-                        if item in ship.dots():
-                            return self.__ship_symbol
-                    return self.board[item.x][item.y]
+            return self.view.cell(self, item)
         else:
             raise KeyError
 
+    def get_row_symbols(self, x):
+#       the symbols of all the cells of the row x, as __getitem__ gives them one by one
+        return self.view.row(self, x)
+
     def out(self, dot):
         if isinstance(dot, Dot):
-            if (0 <= dot.x < len(self.board[0])) and (0 <= dot.y < len(self.board)):
+            if (0 <= dot.x < self.__height) and (0 <= dot.y < self.__width):
                 return False
             return True
         else:
@@ -345,22 +979,25 @@ class Board:
     def shot(self, dot):
         if isinstance(dot, Dot):
             if not self.out(dot):
-                if self.board[dot.x][dot.y] == self.__blank_symbol:
-                    for ship in self.ships:
-                        if dot in ship.dots():
-                            self.__last_turn = Dot(dot.x, dot.y)
-                            self.board[dot.x][dot.y] = self.__hit_symbol
-                            ship.lives = ship.lives - 1
-                            if ship.lives == 0:
-                                self.alive_ships -= 1
-                                for killed_dot in ship.dots():
-                                    self.board[killed_dot.x][killed_dot.y] = self.__kill_symbol
-                                return KILL_ST
-                            return HIT_ST
+                x, y = dot.x, dot.y
+                shot_rows = self.__shot_mask.rows
+                row = shot_rows.get(x, 0)
+                if not row >> y & 1:
+                    self.__last_turn = dot
+                    shot_rows[x] = row | (1 << y)
+                    self.__block_cell(x, y)
+                    ship = self.__ship_at.get(dot)
+                    if ship is not None:
+                        ship.lives = ship.lives - 1
+                        if ship.lives == 0:
+                            self.alive_ships -= 1
+                            self.__mark_killed(ship)
+                            return KILL_ST
+                        self.__hit_mask.add(x, y)
+                        return HIT_ST
                 else:
                     raise DotIsOccupiedException
-                self.board[dot.x][dot.y] = self.__miss_symbol
-                self.__last_turn = Dot(dot.x, dot.y)
+                self.__miss_mask.add(x, y)
                 return MISS_ST
             else:
                 raise BoardOutException
@@ -368,21 +1005,28 @@ class Board:
             raise TypeError("Dot must be Dot class object")
 
     def save_result(self, dot, status):
+#       returns the mask of the cells the result made known, the shot one and the empty ones around the ships
         if isinstance(dot, Dot):
-            if status in self.__enum_status:
-                self.board[dot.x][dot.y] = self.__enum_status[status]
-                self.__last_turn = Dot(dot.x, dot.y)
-                if status in (HIT_ST, KILL_ST):
-                    self.append_ship(Ship(1, Dot(dot.x, dot.y), False))
-                    if status == KILL_ST:
-                        for ship in self.ships:
-                            if dot in ship.dots():
-                                ship.lives = 0
-                                for redraw_dot in ship.dots():
-                                    self.board[redraw_dot.x][redraw_dot.y] = self.__kill_symbol
-                                break
+            if status in (MISS_ST, HIT_ST, KILL_ST):
+                x, y = dot.x, dot.y
+                self.__shot_mask.add(x, y)
+                free = self.__block_cell(x, y)
+                self.__last_turn = dot
+                if status == MISS_ST:
+                    self.__miss_mask.add(x, y)
+                    return 1 << (x * self.__width + y) if free else 0
+                blocked = RowMask({x: 1 << y}) if free else RowMask()
+                self.__hit_mask.add(x, y)
+                self.append_ship(Ship(1, Dot(dot.x, dot.y), False))
+                ship = self.__ship_at[dot]
+                if status == KILL_ST:
+                    ship.lives = 0
+                    blocked.update(self.__mark_killed(ship))
+                else:
+                    blocked.update(self.__block_wounded(ship))
+                return blocked.to_int(self.__width)
             else:
-                raise TypeError("status must be in Board.__enum_status")
+                raise TypeError("status must be one of MISS_ST, HIT_ST or KILL_ST")
         else:
             raise TypeError("dot must be Dot class object")
 
@@ -395,21 +1039,54 @@ class Player:
              'q', 'r', 's', 't',
              'u', 'v', 'w', 'x',
              'y', 'z']
-
-    def __init__(self, board_size=BOARD_SIZE):
-        self.player_board = Board(board_size)
-        self.enemy_board = Board(board_size)
+#   a search of add_ships_random is started again after this many dead ends, this many times at most
+    MAX_BACKTRACKS = 200
+    MAX_RESTARTS = 50
+#   (width, height, lengths) -> layouts.LayoutCounter of the empty board, the exact count of the dense fleets
+#   is made once per process
+    __counters = {}
+
+    def __init__(self, board_size=BOARD_SIZE, height=None, rng=None):
+#       random.Random of all the random choices of the player
+        self.rng = rng if rng is not None else Random()
+        self.player_board = Board(board_size, height, self.rng)
+        self.enemy_board = Board(board_size, height, self.rng)
         self.player_board.hid = False
         self.enemy_board.hid = True
+#       the dead ends of the last add_ships_random: backtracks - a ship taken back,
+#       restarts - the searches given up and started again with fresh random choices
+        self.placement_stats = None
+
+    @classmethod
+    def row_label(cls, x):
+#       a, b, ..., z, aa, ab, ..., zz, aaa, ... like the spreadsheet columns
+        label = ''
+        x += 1
+        while x:
+            x, char = divmod(x - 1, len(cls.CHARS))
+            label = cls.CHARS[char] + label
+        return label
+
+    @classmethod
+    def row_index(cls, label):
+        x = 0
+        for char in label:
+            x = x * len(cls.CHARS) + cls.CHARS.index(char) + 1
+        return x - 1
+
+    def get_label_width(self):
+        return len(self.row_label(self.player_board.height - 1))
 
     def ask(self):
         pass
 
+    def ask_steps(self):
+        return (yield CALL_REQ, self.ask)
+
     def save_move(self, dot, status):
         if status == LOOSE_ST:
-            self.enemy_board.save_result(dot, KILL_ST)
-        else:
-            self.enemy_board.save_result(dot, status)
+            return self.enemy_board.save_result(dot, KILL_ST)
+        return self.enemy_board.save_result(dot, status)
 
     def move(self, dot):
         if isinstance(dot, Dot):
@@ -425,242 +1102,539 @@ class Player:
         else:
             raise TypeError("Dot must be Dot class object")
 
+    def format_board(self):
+        width = self.player_board.width
+        label_width = self.get_label_width()
+#       the columns are 2 characters apart, only the last digit of the column number fits
+        numbers = ' '.join(str(i)[-1] for i in range(1, width + 1))
+        lines = ['']
+        lines.append('      ' + 'Моё поле'.center((width*2-1)+2+2*label_width, ' ') +
+                     '     ' +
+                     'Поле противника'.center((width*2-1)+2+2*label_width, ' '))
+        lines.append('      '+' '*label_width+' '+numbers+' '*(2*label_width+7)+numbers)
+        for x in range(self.player_board.height):
+            label = self.row_label(x)
+            lines.append('      '+label.rjust(label_width)+' ' +
+                         ' '.join(self.player_board.get_row_symbols(x)) + ' ' +
+                         label.ljust(label_width)+'     '+label.rjust(label_width)+' ' +
+                         ' '.join(self.enemy_board.get_row_symbols(x)) +
+                         ' '+label)
+        lines.append('      '+' '*label_width+' '+numbers+' '*(2*label_width+7)+numbers)
+        return '\n'.join(lines)
+
     def print_board(self):
-        print()
-        print('      ' + 'Моё поле'.center((self.player_board.board_size*2-1)+4, ' ') +
-              '     ' +
-              'Поле противника'.center((self.enemy_board.board_size*2-1)+4, ' '))
-        print('        '+' '.join(str(i) for i in range(1, self.player_board.board_size+1)) +
-              '         '+' '.join(str(i) for i in range(1, self.enemy_board.board_size+1)))
-        for x in range(self.player_board.board_size):
-            print('      '+self.CHARS[x]+' ' +
-                  ' '.join(self.player_board[x, y] for y in range(self.player_board.board_size)) + ' ' +
-                  self.CHARS[x]+'     '+self.CHARS[x]+' ' +
-                  ' '.join(self.enemy_board[x, y] for y in range(self.enemy_board.board_size))+' '+self.CHARS[x])
-        print('        '+' '.join(str(i) for i in range(1, self.player_board.board_size+1)) +
-              '         '+' '.join(str(i) for i in range(1, self.enemy_board.board_size+1)))
+        print(self.format_board())
 
     def add_ships(self, ships):
         pass
 
     def add_ships_random(self, ships):
-        for ship in ships:
-            next_ship = False
-            orientation = True if randint(0, 1) == 0 else False
-            free_dots = self.player_board.get_free_dots()
-            while not next_ship:
-                if not free_dots:
-                    self.player_board.erase_ships()
-                    return self.add_ships_random(ships)
-                ship.start_point = free_dots[randint(0, len(free_dots)-1)]
-                ship.orientation = orientation
-                try:
-                    self.player_board.add_ship(ship)
-                except (BoardOutException, ShipWrongPosition):
-                    try:
-                        ship.orientation = ~ship.orientation
-                        self.player_board.add_ship(ship)
-                    except (BoardOutException, ShipWrongPosition):
-                        free_dots.remove(ship.start_point)
-                    else:
-                        next_ship = True
-                else:
-                    next_ship = True
+#       depth first search over the start masks, so a dead end only takes back the last ship
+#       and the ships are created on the board only when the whole fleet has found its place;
+#       a search running into MAX_BACKTRACKS dead ends starts again with fresh random choices, after
+#       MAX_RESTARTS of them the fleet is sampled from the exact count on the small boards and searched
+#       with no limit on the others, so it is only taken as not fitting when no layout exists
+        stats = self.placement_stats = {'backtracks': 0, 'restarts': 0}
+        for _ in range(self.MAX_RESTARTS):
+            placements = self.__search_placements(ships, stats, self.MAX_BACKTRACKS)
+            if placements is not None:
+                break
+            stats['restarts'] += 1
+        else:
+            placements = self.__sample_placements(ships)
+            if placements is None:
+                placements = self.__search_placements(ships, stats)
+        board = self.player_board
+        for ship, (start, orientation) in zip(ships, placements):
+            ship.start_point = Dot(*divmod(start, board.width))
+            ship.orientation = orientation
+            board.add_ship(ship)
+
+    def __search_placements(self, ships, stats, max_backtracks=None):
+#       (start, orientation) of every ship or None after max_backtracks dead ends
+        board = self.player_board
+        halos = [board.get_halo_mask()] + [0] * len(ships)
+        tried = [(0, 0)] * len(ships)
+        placements = [None] * len(ships)
+#       the lengths of the ships placed after each one and the number of the 2x2 blocks they need
+        rests = [{ship.length for ship in ships[index + 1:]} for index in range(len(ships))]
+        blocks = [sum((ship.length + 1) // 2 for ship in ships[index + 1:]) for index in range(len(ships))]
+        if board.get_block_count(halos[0]) < blocks[0] + (ships[0].length + 1) // 2:
+            raise ShipWrongPosition("There is no room on the board for the ships!")
+        backtracks = 0
+        index = 0
+        while index < len(ships):
+            length = ships[index].length
+            horizontal, vertical = board.get_start_masks(length, halos[index])
+            horizontal &= ~tried[index][0]
+            vertical &= ~tried[index][1]
+            if max_backtracks is None and index and ships[index - 1].length == length:
+#               the search with no limit has to try every layout, so the ships of the same length
+#               only go in the order of their starts
+                previous = placements[index - 1][0]
+                horizontal &= -1 << (previous + 1)
+                vertical &= -1 << (previous + 1)
+            horizontal_count = horizontal.bit_count()
+            count = horizontal_count + vertical.bit_count()
+            if not count:
+                if index == 0:
+                    raise ShipWrongPosition("There is no room on the board for the ships!")
+                stats['backtracks'] += 1
+                backtracks += 1
+                if max_backtracks is not None and backtracks > max_backtracks:
+                    return None
+                tried[index] = (0, 0)
+                index -= 1
+                continue
+            choice = self.rng.randrange(count)
+            if choice < horizontal_count:
+                start = board.nth_set_bit(horizontal, choice)
+                tried[index] = (tried[index][0] | (1 << start), tried[index][1])
+                orientation = True
+            else:
+                start = board.nth_set_bit(vertical, choice - horizontal_count)
+                tried[index] = (tried[index][0], tried[index][1] | (1 << start))
+                orientation = False
+            halo = halos[index] | board.get_area_mask(start, length, orientation)
+#           forward checking, a place leaving no start for one of the ships still to place is skipped at once
+            if board.get_block_count(halo) < blocks[index] or \
+                    not all(any(board.get_start_masks(rest, halo)) for rest in rests[index]):
+                continue
+            placements[index] = (start, orientation)
+            halos[index + 1] = halo
+            index += 1
+        return placements
+
+    def __sample_placements(self, ships):
+#       (start, orientation) of every ship in a uniformly random layout of the fleet on the empty small board,
+#       None on the other boards
+        from layouts import LayoutCounter, NoLayoutException
+
+        board = self.player_board
+        if board.ships or board.width * board.height > LayoutCounter.EXACT_CELLS:
+            return None
+        lengths = tuple(sorted((ship.length for ship in ships), reverse=True))
+        key = (board.width, board.height, lengths)
+        counter = self.__counters.get(key)
+        if counter is None:
+            counter = LayoutCounter(Board(board.width, board.height), lengths)
+            self.__counters[key] = counter
+        counter.rng = self.rng
+        try:
+            layout = counter.sample()
+        except NoLayoutException:
+            raise ShipWrongPosition("There is no room on the board for the ships!")
+        starts = {}
+        for ship in layout:
+            starts.setdefault(ship.length, []).append(
+                (ship.start_point.x * board.width + ship.start_point.y, ship.orientation))
+        return [starts[ship.length].pop() for ship in ships]
 
 
 class Ai(Player):
-    def __init__(self, board_size=BOARD_SIZE):
-        Player.__init__(self, board_size)
-
-    def ask(self):
+    def __init__(self, board_size=BOARD_SIZE, time_budget=None, height=None, rng=None, fleet=FLEET):
+        Player.__init__(self, board_size, height, rng)
+#       seconds per move, None - no limit
+        self.time_budget = time_budget
+#       perf_counter() time the move asked now has to be made by, None - no limit; the candidates searching
+#       for long check it themselves
+        self.deadline = None
+#       the lengths of the enemy ships, the strategies counting the ships left take them from here
+        self.fleet = tuple(fleet)
+#       the shots to make first while no ship is wounded, see book.PlacementBook
+        self.opening = []
+#       (future of the next move, enemy board state it was asked at) while the move is computed ahead
+        self.__speculation = None
+
+    def candidates(self):
+#       yields moves, every next one is at least as good as the previous,
+#       ask() takes the last one yielded before the time budget runs out
         free_dots = self.enemy_board.get_ships_edges()
         if free_dots:
-            return free_dots[randint(0, len(free_dots)-1)]
+            yield free_dots[self.rng.randrange(len(free_dots))]
         else:
-            free_dots = self.enemy_board.get_free_dots()
-            if free_dots:
-                return free_dots[randint(0, len(free_dots)-1)]
-        return None
+            for dot in self.opening:
+                if self.enemy_board.is_free(dot):
+                    yield dot
+                    return
+            yield self.enemy_board.get_random_free_dot()
+
+    def restore(self):
+#       rebuilds the strategy's own state from enemy_board after Game.load
+        pass
+
+    def ask(self):
+        deadline = self.deadline = None if self.time_budget is None else perf_counter() + self.time_budget
+        best = None
+        for dot in self.candidates():
+            if dot is not None:
+                best = dot
+            if deadline is not None and perf_counter() >= deadline:
+                break
+        return best
+
+    def get_board_state(self):
+#       changes with every result saved on enemy_board, the only board the moves depend on
+        return self.enemy_board.get_last_turn(), self.enemy_board.get_free_count()
+
+    def speculate(self, executor):
+#       starts the next move in the executor while the user thinks, the user's shots only change the AI's own
+#       board, so the move stays valid until a result is saved on enemy_board
+        self.cancel_speculation()
+        self.__speculation = (executor.submit(self.ask), self.get_board_state())
+
+    def cancel_speculation(self):
+#       a move already running finishes in its worker and is dropped
+        if self.__speculation is not None:
+            self.__speculation[0].cancel()
+            self.__speculation = None
+
+    def __take_speculation(self):
+        future, state = self.__speculation
+        self.__speculation = None
+#       the move is waited for even if it is stale, so two moves of the AI never run at once
+        dot = future.result()
+        if state == self.get_board_state():
+            return dot
+        return self.ask()
+
+    def ask_steps(self):
+        if self.__speculation is not None:
+            return (yield CALL_REQ, self.__take_speculation)
+        return (yield CALL_REQ, self.ask)
 
 
 class User(Player):
-    def __init__(self, board_size=BOARD_SIZE):
-        Player.__init__(self, board_size)
+#   the row letters or the row number and a separator, then the column number: a1, ab12, 7 12, 7,12
+    DOT_REGEX = r'\s*(?:([a-z]+)\s*|(\d+)(?:\s*[,;:.]\s*|\s+))(\d+)\s*'
+#   compiled on the first parse, the re module takes longer to import than the whole game module
+    DOT_PATTERN = None
+
+    def __init__(self, board_size=BOARD_SIZE, height=None, rng=None):
+        Player.__init__(self, board_size, height, rng)
         pass
 
-    def __check_input(self, turn):
-        dot = [None, None]
-        while None in dot:
-            if len(turn) == 2:
-                dot[0] = self.CHARS.index(list(turn)[0]) if list(turn)[0] in self.CHARS else None
-                dot[1] = int(list(turn)[1]) - 1 if turn[1].isdigit() else None
-            if None in dot:
-                turn = input("Введите точку в формате RC, где: R - буква строки, C - номер колонки: ").lower()
-        return Dot(*dot)
+    @classmethod
+    def get_dot_pattern(cls):
+        if cls.DOT_PATTERN is None:
+            import re
+            cls.DOT_PATTERN = re.compile(cls.DOT_REGEX)
+        return cls.DOT_PATTERN
+
+    def parse_dot(self, turn):
+        match = self.get_dot_pattern().fullmatch(turn)
+        if match is not None:
+            letters, row, column = match.groups()
+            x = self.row_index(letters) if letters is not None else int(row) - 1
+            return Dot(x, int(column) - 1)
+        return None
+
+    def check_input_steps(self, turn):
+        dot = self.parse_dot(turn)
+        while dot is None:
+            turn = (yield INPUT_REQ, "Введите точку в формате RC, где: R - буквы строки или её номер через пробел, "
+                                     "C - номер колонки: ").lower()
+            dot = self.parse_dot(turn)
+        return dot
 
     def ask(self):
-        turn = input("\nВаш ход: ").lower()
-        return self.__check_input(turn)
+        return run_steps(self.ask_steps())
+
+    def ask_steps(self):
+        turn = (yield INPUT_REQ, "\nВаш ход: ").lower()
+        return (yield from self.check_input_steps(turn))
 
     def add_ships(self, ships):
-        self.print_board()
-        for ship in ships:
-            next_ship = False
-            print()
-            while not next_ship:
-                free_dots = self.player_board.get_free_dots()
-                while free_dots:
-                    ship.start_point = free_dots[randint(0, len(free_dots) - 1)]
-                    if not self.player_board.try_ship(ship):
-                        ship.orientation = ~ship.orientation
-                        if not self.player_board.try_ship(ship):
-                            free_dots.remove(ship.start_point)
-                        else:
-                            break
-                    else:
-                        break
-                    if not free_dots:
-                        print("Похоже нет места для размещения корабля, попробуйте расставить корабли ещё раз!")
-                        self.player_board.erase_ships()
-                        return self.add_ships(ships)
-
-                print(f"Осталось разместить кораблей: {len(ships) - ships.index(ship)}")
-                text = input(f"Введите начальную точку корабля размером {ship.length} палубы: ")
-                start_dot = self.__check_input(text)
-                ship.start_point = start_dot
-                text = ""
-                if ship.length > 1:
-                    while text not in ("h", "v", "г", "в"):
-                        text = input(f"Введите ориентацию корабля (h или г - горизонтально, v или в - вертикально): ")
-                    ship.orientation = True if text in ("h", "г") else False
-                try:
-                    self.player_board.add_ship(ship)
-                except BoardOutException:
-                    print("Корабль выходит за пределы игрового поля, попробуйте ввести расположение ещё раз!")
-                except ShipWrongPosition:
-                    print("Корабли столкнулись, попробуйте ввести расположение ещё раз!")
-                else:
-                    next_ship = True
-                    self.print_board()
+        run_steps(self.add_ships_steps(ships))
+
+    def add_ships_steps(self, ships):
+        yield RENDER_REQ, self.format_board
+        index = 0
+        while index < len(ships):
+            ship = ships[index]
+            yield OUTPUT_REQ, ""
+            if not any(self.player_board.get_start_masks(ship.length)):
+                yield OUTPUT_REQ, "Похоже нет места для размещения корабля, попробуйте расставить корабли ещё раз!"
+                self.player_board.erase_ships()
+                yield RENDER_REQ, self.format_board
+                index = 0
+                continue
+
+            yield OUTPUT_REQ, f"Осталось разместить кораблей: {len(ships) - index}"
+            text = yield INPUT_REQ, f"Введите начальную точку корабля размером {ship.length} палубы: "
+            start_dot = yield from self.check_input_steps(text)
+            ship.start_point = start_dot
+            text = ""
+            if ship.length > 1:
+                while text not in ("h", "v", "г", "в"):
+                    text = yield INPUT_REQ, (f"Введите ориентацию корабля "
+                                             f"(h или г - горизонтально, v или в - вертикально): ")
+                ship.orientation = True if text in ("h", "г") else False
+            try:
+                self.player_board.add_ship(ship)
+            except BoardOutException:
+                yield OUTPUT_REQ, "Корабль выходит за пределы игрового поля, попробуйте ввести расположение ещё раз!"
+            except ShipWrongPosition:
+                yield OUTPUT_REQ, "Корабли столкнулись, попробуйте ввести расположение ещё раз!"
+            else:
+                index += 1
+                yield RENDER_REQ, self.format_board
 
 
 class Game:
-    def __init__(self, board_size=BOARD_SIZE):
-        self.user = User(board_size)
-        self.ai = Ai(board_size)
+#   magic, version, board size, board height, current player, AI time budget (NaN if none), AI strategy name length
+    SNAPSHOT_HEADER = struct.Struct('<4sBHHBdB')
+#   the version 1 snapshots are of the square boards and have no height
+    SNAPSHOT_HEADER_V1 = struct.Struct('<4sBHBdB')
+
+    def __init__(self, board_size=BOARD_SIZE, strategy='hunt', time_budget=None, move_log=None, game_id=0,
+                 renderer=None, height=None, seed=None, book=None, executor=None, plain=False):
+        self.board_size = board_size
+        self.height = board_size if height is None else height
+        self.strategy = strategy
+#       movelog.MoveLogWriter recording every move of the game or None
+        self.move_log = move_log
+        self.game_id = game_id
+#       renderer.DiffRenderer redrawing only the changed cells or None to print the whole board every time
+        self.renderer = renderer
+#       book.BookCache with the fleet layouts and the AI openings or None to place the fleets from scratch
+        self.book = book
+#       concurrent.futures executor the AI computes its next move in during the user's turn or None
+        self.executor = executor
+#       the boards and the messages with no escape codes, for the output that is not a terminal
+        self.plain = plain
+#       called after every shot as hook(player, dot, result, seconds), player is 1 for the user and 2 for the AI,
+#       seconds is the time from asking for the shot to saving its result, nothing is timed without hooks
+        self.turn_hooks = []
+#       the same seed gives the same fleets and the same AI moves for the same user moves
+        self.seed = seed
+        user_rng, ai_rng = split_rng(Random(seed), 2)
+        self.user = User(board_size, self.height, user_rng)
+        if plain:
+            self.user.player_board.view = PlainBoardView()
+            self.user.enemy_board.view = PlainBoardView()
+#       every strategy, the default hunt one too, comes from the registry of the strategies module, imported on
+#       the first game only, its heavy modules are imported by the strategies that use them
+        from strategies import make_ai
+        self.ai = make_ai(strategy, board_size, time_budget, self.height, ai_rng)
         self.__turn_iter = self.__turn(1, 2)
         self.__current_player = next(self.__turn_iter)
 
     def get_current_player(self):
         return self.__current_player
 
+    def dump(self):
+        strategy = self.strategy.encode()
+        time_budget = float('nan') if self.ai.time_budget is None else self.ai.time_budget
+        data = [self.SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.board_size, self.height,
+                                          self.__current_player, time_budget, len(strategy)), strategy]
+        for board in (self.user.player_board, self.user.enemy_board, self.ai.player_board, self.ai.enemy_board):
+            data.append(board.dump())
+        return b''.join(data)
+
+    @classmethod
+    def load(cls, data, seed=None):
+        from strategies import UnknownStrategyException
+
+        try:
+            magic, version = cls.SNAPSHOT_HEADER.unpack_from(data)[:2]
+            if magic != SNAPSHOT_MAGIC:
+                raise SnapshotException
+            if 2 <= version <= SNAPSHOT_VERSION:
+                _, _, board_size, height, current_player, time_budget, strategy_length = \
+                    cls.SNAPSHOT_HEADER.unpack_from(data)
+                offset = cls.SNAPSHOT_HEADER.size
+            elif version == 1:
+                _, _, board_size, current_player, time_budget, strategy_length = \
+                    cls.SNAPSHOT_HEADER_V1.unpack_from(data)
+                height = board_size
+                offset = cls.SNAPSHOT_HEADER_V1.size
+            else:
+                raise SnapshotException
+            if len(data) < offset + strategy_length:
+                raise SnapshotException
+            strategy = bytes(data[offset:offset + strategy_length]).decode()
+            offset += strategy_length
+            game = cls(board_size, strategy, None if isnan(time_budget) else time_budget, height=height, seed=seed)
+            for board in (game.user.player_board, game.user.enemy_board, game.ai.player_board, game.ai.enemy_board):
+                offset = board.load(data, offset, version)
+        except (struct.error, UnicodeDecodeError, ValueError, UnknownStrategyException):
+            raise SnapshotException
+        game.ai.restore()
+        while game.get_current_player() != current_player:
+            game.__current_player = next(game.__turn_iter)
+        return game
+
+    def format_board(self):
+        if self.renderer is not None:
+            return self.renderer.frame(self.user)
+        return self.user.format_board()
+
+    @staticmethod
+    def place_ships(player, ships, book=None):
+        if book is None:
+            player.add_ships_random(ships)
+        else:
+            book.place(player, ships)
+
+    @staticmethod
+    def make_ships(fleet=FLEET):
+        return [Ship(length, Dot(0, 0), True) for length in fleet]
+
     @classmethod
     def __turn(cls, a, b):
         while True:
             yield a
             yield b
 
-    def greet(self):
+    def text(self, text):
+        return strip_colors(text) if self.plain else text
+
+    def greeting(self):
         symbols = self.user.player_board.get_symbols()
-        print("\nКонсольная игра 'Морской бой'\n")
-        print("Обозначения игрового поля:")
-        print(f"  {symbols[MISS_ST]}\033[0m - промах")
-        print(f"  {symbols[SHIP_ST]}\033[0m - корабль")
-        print(f"  {symbols[HIT_ST]}\033[0m - подбитый корабль")
-        print(f"  {symbols[KILL_ST]}\033[0m - потопленый корабль")
-        print(f"  {symbols[LAST_SYM_ST]}{symbols[MISS_ST]} {symbols[LAST_SYM_ST]}{symbols[HIT_ST]} "
-              f"{symbols[LAST_SYM_ST]}{symbols[KILL_ST]}"
-              f"\033[0m - обозначения последнего сделанного хода (промах, подбитый, потопленный)\n")
-
-    def loop(self):
+        lines = [
+            "\nКонсольная игра 'Морской бой'\n",
+            "Обозначения игрового поля:",
+            f"  {symbols[MISS_ST]}\033[0m - промах",
+            f"  {symbols[SHIP_ST]}\033[0m - корабль",
+            f"  {symbols[HIT_ST]}\033[0m - подбитый корабль",
+            f"  {symbols[KILL_ST]}\033[0m - потопленый корабль",
+        ]
+        if symbols[LAST_SYM_ST]:
+            lines.append(f"  {symbols[LAST_SYM_ST]}{symbols[MISS_ST]} {symbols[LAST_SYM_ST]}{symbols[HIT_ST]} "
+                         f"{symbols[LAST_SYM_ST]}{symbols[KILL_ST]}"
+                         f"\033[0m - обозначения последнего сделанного хода (промах, подбитый, потопленный)")
+        lines[-1] += "\n"
+        return self.text("\n".join(lines))
+
+    def greet(self):
+        print(self.greeting())
+
+    @staticmethod
+    def result_messages(user_turn, result, enemy_player):
+        if user_turn:
+            if result == HIT_ST:
+                return ["Есть попадание, корабль противника \033[33mранен\033[0m!",
+                        "Сделайте ещё выстрел."]
+            elif result == KILL_ST:
+                return ["Есть попадание, корабль противника \033[31mпотоплен\033[0m!",
+                        f"У противника осталось кораблей: "
+                        f"\033[32m{enemy_player.player_board.get_alive_ships_count()}\033[0m",
+                        "Сделайте ещё выстрел."]
+            elif result == MISS_ST:
+                return ["\033[34mМимо\033[0m!"]
+            elif result == LOOSE_ST:
+                return ["\033[32m\033[1mПобеда\033[0m!"]
+        else:
+            if result == HIT_ST:
+                return ["Есть попадание, ваш корабль \033[33mранен\033[0m!",
+                        "Компьютер ходит ещё раз."]
+            elif result == KILL_ST:
+                return ["Есть попадание, ваш корабль \033[31mпотоплен\033[0m!",
+                        f"У вас осталось кораблей: "
+                        f"\033[32m{enemy_player.player_board.get_alive_ships_count()}\033[0m",
+                        "Компьютер ходит ещё раз."]
+            elif result == MISS_ST:
+                return ["Компьютер \033[34mпромазал\033[0m!"]
+            elif result == LOOSE_ST:
+                return ["Компьютер \033[32m\033[1mпобедил\033[0m!"]
+        return []
+
+    def loop(self, on_event=None):
+        run_steps(self.loop_steps(), on_event)
+
+    def placement_event(self, player):
+        ships = (self.user if player == 1 else self.ai).player_board.ships
+        return PlacementEvent(self.game_id, player, tuple((ship.length, ship.start_point.x, ship.start_point.y,
+                                                           bool(ship.orientation)) for ship in ships))
+
+    def loop_steps(self):
         win = False
+        turns = 0
         while not win:
+            turns += 1
             if self.__current_player == 1:
                 current_player = self.user
                 enemy_player = self.ai
+                if self.executor is not None:
+                    self.ai.speculate(self.executor)
             else:
                 current_player = self.ai
                 enemy_player = self.user
 
             if self.__current_player == 1:
-                print("\nВаш ход!")
+                yield OUTPUT_REQ, "\nВаш ход!"
             else:
-                print("\nХодит компьютер.")
+                yield OUTPUT_REQ, "\nХодит компьютер."
 
             result = HIT_ST
             while result in (HIT_ST, KILL_ST):
-                dot = current_player.ask()
+                started = perf_counter() if self.turn_hooks else None
+                dot = yield from current_player.ask_steps()
+                yield EVENT_REQ, ShotEvent(self.game_id, self.__current_player, dot.x, dot.y)
                 result = enemy_player.move(dot)
                 while result in (OCCUPIED_ST, OUT_ST):
+                    yield EVENT_REQ, ResultEvent(self.game_id, self.__current_player, dot.x, dot.y, result)
                     if self.__current_player == 1:
                         if result == OCCUPIED_ST:
-                            print("Выстрел в эту точку уже сделан!")
+                            yield OUTPUT_REQ, "Выстрел в эту точку уже сделан!"
                         elif result == OUT_ST:
-                            print("Выстрел мимо игрового поля!")
-                    dot = current_player.ask()
+                            yield OUTPUT_REQ, "Выстрел мимо игрового поля!"
+                    dot = yield from current_player.ask_steps()
+                    yield EVENT_REQ, ShotEvent(self.game_id, self.__current_player, dot.x, dot.y)
                     result = enemy_player.move(dot)
                 current_player.save_move(dot, result)
-                self.user.print_board()
-                print()
-                if self.__current_player == 1:
-                    if result == HIT_ST:
-                        print("Есть попадание, корабль противника \033[33mранен\033[0m!")
-                        print("Сделайте ещё выстрел.")
-                    elif result == KILL_ST:
-                        print("Есть попадание, корабль противника \033[31mпотоплен\033[0m!")
-                        print(f"У противника осталось кораблей: "
-                              f"\033[32m{enemy_player.player_board.get_alive_ships_count()}\033[0m")
-                        print("Сделайте ещё выстрел.")
-                    elif result == MISS_ST:
-                        print("\033[34mМимо\033[0m!")
-                    elif result == LOOSE_ST:
-                        print("\033[32m\033[1mПобеда\033[0m!")
-                        win = True
-                else:
-                    if result == HIT_ST:
-                        print("Есть попадание, ваш корабль \033[33mранен\033[0m!")
-                        print("Компьютер ходит ещё раз.")
-                    elif result == KILL_ST:
-                        print("Есть попадание, ваш корабль \033[31mпотоплен\033[0m!")
-                        print(f"У вас осталось кораблей: "
-                              f"\033[32m{enemy_player.player_board.get_alive_ships_count()}\033[0m")
-                        print("Компьютер ходит ещё раз.")
-                    elif result == MISS_ST:
-                        print("Компьютер \033[34mпромазал\033[0m!")
-                    elif result == LOOSE_ST:
-                        print("Компьютер \033[32m\033[1mпобедил\033[0m!")
-                        win = True
+                if started is not None:
+                    elapsed = perf_counter() - started
+                    for hook in self.turn_hooks:
+                        hook(self.__current_player, dot, result, elapsed)
+                if self.move_log is not None:
+                    self.move_log.write(self.game_id, self.__current_player, dot, result)
+                yield EVENT_REQ, ResultEvent(self.game_id, self.__current_player, dot.x, dot.y, result)
+                if result in (KILL_ST, LOOSE_ST):
+                    ship = enemy_player.player_board.get_ship(dot)
+                    yield EVENT_REQ, KillEvent(self.game_id, self.__current_player, ship.length, ship.start_point.x,
+                                               ship.start_point.y, bool(ship.orientation))
+                if result == LOOSE_ST:
+                    yield EVENT_REQ, GameOverEvent(self.game_id, self.__current_player, turns)
+                yield RENDER_REQ, self.format_board
+                yield OUTPUT_REQ, ""
+                for message in self.result_messages(self.__current_player == 1, result, enemy_player):
+                    yield OUTPUT_REQ, self.text(message)
+                if result == LOOSE_ST:
+                    win = True
+                    self.ai.cancel_speculation()
             self.__current_player = next(self.__turn_iter)
 
-    def start(self):
-        self.greet()
-
-        ships_user = [
-            Ship(3, Dot(0, 0), True),
-            Ship(2, Dot(0, 0), True),
-            Ship(2, Dot(0, 0), True),
-            Ship(1, Dot(0, 0), True),
-            Ship(1, Dot(0, 0), True),
-            Ship(1, Dot(0, 0), True),
-            Ship(1, Dot(0, 0), True)
-        ]
+    def start(self, on_event=None):
+        run_steps(self.start_steps(), on_event)
 
-        ships_ai = [
-            Ship(3, Dot(0, 0), True),
-            Ship(2, Dot(0, 0), True),
-            Ship(2, Dot(0, 0), True),
-            Ship(1, Dot(0, 0), True),
-            Ship(1, Dot(0, 0), True),
-            Ship(1, Dot(0, 0), True),
-            Ship(1, Dot(0, 0), True)
-        ]
-        key = input("Хотите расставить корабли вручную? (Д, Y - да): ")
-        if key.lower() in ("y", "д"):
-            self.user.add_ships(ships_user)
-        else:
-            self.user.add_ships_random(ships_user)
-            self.user.print_board()
-
-        self.ai.add_ships_random(ships_ai)
+    def start_steps(self):
+        yield OUTPUT_REQ, self.greeting()
 
-        self.loop()
+        ships_user = self.make_ships()
+        ships_ai = self.make_ships()
+        book = self.book.get(self.board_size, FLEET, self.height) if self.book is not None else None
+#       the book is held while the user answers, so the cache doesn't close it under the game
+        try:
+            key = yield INPUT_REQ, "Хотите расставить корабли вручную? (Д, Y - да): "
+            if key.lower() in ("y", "д"):
+                yield from self.user.add_ships_steps(ships_user)
+            else:
+                self.place_ships(self.user, ships_user, book)
+                yield RENDER_REQ, self.format_board
+            yield EVENT_REQ, self.placement_event(1)
+
+            self.place_ships(self.ai, ships_ai, book)
+            if book is not None:
+                self.ai.opening = book.get_opening()
+        finally:
+            if book is not None:
+                self.book.release(book)
+        yield EVENT_REQ, self.placement_event(2)
+
+        if self.move_log is not None:
+            self.move_log.start(self.game_id, self.board_size, self.height)
+        yield from self.loop_steps()
+        if self.renderer is not None:
+            yield OUTPUT_REQ, self.renderer.reset()
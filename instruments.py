@@ -0,0 +1,138 @@
+from collections import Counter, defaultdict
+from time import perf_counter
+
+
+class Histogram:
+#   bucket k counts the times from 2**(k-1) to 2**k microseconds, bucket 0 - less than a microsecond
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.buckets[int(seconds * 1e6).bit_length()] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        return self
+
+    def percentile_us(self, percent):
+#       the upper bound of the bucket the percentile falls into
+        if not self.count:
+            return 0
+        rank = max(1, percent / 100 * self.count)
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= rank:
+                return 1 << bucket
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_us': self.total / self.count * 1e6 if self.count else 0.0,
+            'p50_us': self.percentile_us(50),
+            'p99_us': self.percentile_us(99),
+            'max_us': self.max * 1e6,
+        }
+
+
+class Instruments:
+#   the methods are timed by wrappers set on the attached objects only, the classes are never changed,
+#   so the objects not attached and the detached ones run with no overhead at all
+    def __init__(self):
+        self.counters = Counter()
+        self.histograms = defaultdict(Histogram)
+        self.__attached = []
+        self.__games = []
+
+    def count(self, name, value=1):
+        self.counters[name] += value
+
+    def time(self, name, seconds):
+        self.histograms[name].add(seconds)
+
+    def wrap(self, obj, name, key):
+        method = getattr(obj, name)
+        histogram = self.histograms[key]
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                histogram.add(perf_counter() - start)
+
+        setattr(obj, name, timed)
+        self.__attached.append((obj, name))
+
+    def attach_board(self, board):
+        self.wrap(board, 'shot', 'Board.shot')
+        self.wrap(board, 'get_free_dots', 'Board.get_free_dots')
+
+    def attach_player(self, player):
+        self.attach_board(player.player_board)
+        self.attach_board(player.enemy_board)
+        self.wrap(player, 'ask', f'{type(player).__name__}.ask')
+        add_ships_random = player.add_ships_random
+        histogram = self.histograms['Player.add_ships_random']
+
+        def placed(ships):
+            start = perf_counter()
+            try:
+                return add_ships_random(ships)
+            finally:
+                histogram.add(perf_counter() - start)
+                self.count('placement.fleets')
+                if player.placement_stats is not None:
+                    self.count('placement.backtracks', player.placement_stats['backtracks'])
+                    self.count('placement.restarts', player.placement_stats['restarts'])
+
+        player.add_ships_random = placed
+        self.__attached.append((player, 'add_ships_random'))
+
+    def on_turn(self, player, dot, result, seconds):
+        self.time(f'turn.player{player}', seconds)
+        self.count(f'result.{result}')
+
+    def attach_game(self, game):
+        self.attach_player(game.user)
+        self.attach_player(game.ai)
+        game.turn_hooks.append(self.on_turn)
+        self.__games.append(game)
+
+    def detach(self):
+        for obj, name in reversed(self.__attached):
+            delattr(obj, name)
+        for game in self.__games:
+            game.turn_hooks.remove(self.on_turn)
+        self.__attached = []
+        self.__games = []
+
+    def merge(self, other):
+        self.counters.update(other.counters)
+        for name, histogram in other.histograms.items():
+            self.histograms[name].merge(histogram)
+        return self
+
+    def summary(self):
+        return {
+            'counters': dict(self.counters),
+            'timings': {name: histogram.summary() for name, histogram in sorted(self.histograms.items())
+                        if histogram.count},
+        }
+
+    def report(self):
+        lines = [f"{name}: {value}" for name, value in sorted(self.counters.items())]
+        for name, timing in self.summary()['timings'].items():
+            lines.append(f"{name}: {timing['count']} calls, mean {timing['mean_us']:.1f} us, "
+                         f"p50 <{timing['p50_us']} us, p99 <{timing['p99_us']} us, max {timing['max_us']:.1f} us")
+        return '\n'.join(lines)
@@ -0,0 +1,191 @@
+from collections import Counter
+from game_classes import FLEET, HIT_ST, MISS_ST, Dot, Ship
+
+
+class NoLayoutException(Exception):
+    def __init__(self, args="No fleet layout matches the shots made on the board!"):
+        Exception.__init__(self, args)
+
+
+class LayoutCounter:
+#   boards up to this number of cells are sampled uniformly with the help of the exact counter
+    EXACT_CELLS = 49
+
+    def __init__(self, board, fleet=FLEET, rng=None, exact=None):
+        self.board = board
+        self.rng = rng if rng is not None else board.rng
+#       True - uniform samples from the exact count, False - the faster search ones, None - by the board size
+        self.exact = exact
+        self.__width = board.width
+        self.__height = board.height
+        self.__cells = self.__width * self.__height
+        masks = board.get_masks()
+        remaining = Counter(fleet)
+#       killed ships are known exactly, they only take their lengths out of the fleet
+        self.__fixed = []
+        self.__forbidden = masks[MISS_ST]
+        for ship in board.ships:
+            if ship.lives == 0:
+                remaining[ship.length] -= 1
+                self.__fixed.append(Ship(ship.length, ship.start_point, ship.orientation))
+                self.__forbidden |= board.get_area_mask(ship.start_point.x * self.__width + ship.start_point.y,
+                                                        ship.length, ship.orientation)
+        self.__possible = all(count >= 0 for count in remaining.values())
+        self.__hits = masks[HIT_ST]
+        self.__lengths = sorted((length for length in remaining if remaining[length] > 0), reverse=True)
+        self.__fleet = tuple(remaining[length] for length in self.__lengths)
+#       the placements starting in every cell, listed when the exact count first gets to the cell, the search
+#       sampling of the larger boards doesn't need them
+        self.__placements = [None] * self.__cells
+        self.__memo = {}
+
+    def __get_placements(self, pos):
+        placements = self.__placements[pos]
+        if placements is None:
+            placements = self.__placements[pos] = self.__list_placements(pos)
+        return placements
+
+    def __list_placements(self, pos):
+        x, y = divmod(pos, self.__width)
+        placements = []
+        for index, length in enumerate(self.__lengths):
+            for orientation in ((True, False) if length > 1 else (True,)):
+                if (y + length > self.__width) if orientation else (x + length > self.__height):
+                    continue
+                step = 1 if orientation else self.__width
+                cells = 0
+                for i in range(length):
+                    cells |= 1 << (pos + i * step)
+#               a ship on the hits only would have been killed already
+                if not cells & self.__forbidden and cells & ~self.__hits:
+                    placements.append((index, cells, self.board.get_area_mask(pos, length, orientation), orientation))
+        return placements
+
+    def __branches(self, pos, fleet, blocked, covered):
+#       either no ship starts in the cell (allowed unless it is an uncovered hit) or one of the fitting ones does
+        bit = 1 << pos
+        branches = []
+        if not self.__hits & bit or covered & bit:
+            branches.append((pos + 1, fleet, blocked, covered, None))
+        if not blocked & bit:
+            for index, cells, area, orientation in self.__get_placements(pos):
+                if fleet[index] and not cells & blocked:
+                    next_fleet = fleet[:index] + (fleet[index] - 1,) + fleet[index + 1:]
+                    branches.append((pos + 1, next_fleet, blocked | area, covered | cells,
+                                     (self.__lengths[index], pos, orientation)))
+        return branches
+
+    def __count(self, pos, fleet, blocked, covered):
+        if not any(fleet):
+            return 0 if (self.__hits & ~covered) >> pos else 1
+        if pos == self.__cells:
+            return 0
+        key = (pos, fleet, blocked >> pos, (covered & self.__hits) >> pos)
+        count = self.__memo.get(key)
+        if count is None:
+            count = sum(self.__count(*branch[:4]) for branch in self.__branches(pos, fleet, blocked, covered))
+            self.__memo[key] = count
+        return count
+
+    def count(self):
+        if not self.__possible:
+            return 0
+        return self.__count(0, self.__fleet, 0, 0)
+
+    def __make_layout(self, placements):
+        return self.__fixed + [Ship(length, Dot(*divmod(pos, self.__width)), orientation)
+                               for length, pos, orientation in placements]
+
+    def __sample_exact(self):
+        total = self.count()
+        if not total:
+            raise NoLayoutException
+        state = (0, self.__fleet, 0, 0)
+        placements = []
+        while any(state[1]):
+            choice = self.rng.randrange(self.__count(*state))
+            for branch in self.__branches(*state):
+                count = self.__count(*branch[:4])
+                if choice < count:
+                    state = branch[:4]
+                    if branch[4] is not None:
+                        placements.append(branch[4])
+                    break
+                choice -= count
+        return self.__make_layout(placements)
+
+    def __get_start_masks(self, length, unavailable):
+#       the starts out of the unavailable cells, but not the ones with all the cells on the hits
+        horizontal, vertical = self.board.get_start_masks(length, unavailable)
+        hit_horizontal, hit_vertical = self.board.get_start_masks(length, ~self.__hits)
+        return horizontal & ~hit_horizontal, vertical & ~hit_vertical
+
+    def __options(self, fleet, blocked, covered):
+#       the lowest uncovered hit has to be covered by the next ship, otherwise the longest ship goes next
+        unavailable = blocked | self.__forbidden
+        uncovered = self.__hits & ~covered
+        options = []
+        if uncovered:
+            hit = (uncovered & -uncovered).bit_length() - 1
+            x, y = divmod(hit, self.__width)
+            for index, length in enumerate(self.__lengths):
+                if fleet[index]:
+                    horizontal, vertical = self.__get_start_masks(length, unavailable)
+                    rows = cols = 0
+                    for i in range(length):
+                        if y - i >= 0:
+                            rows |= 1 << (hit - i)
+                        if x - i >= 0:
+                            cols |= 1 << (hit - i * self.__width)
+                    options.append((index, horizontal & rows, vertical & cols))
+        else:
+            for index, length in enumerate(self.__lengths):
+                if fleet[index]:
+                    options.append((index, *self.__get_start_masks(length, unavailable)))
+                    break
+        return options
+
+    def __sample_search(self):
+#       depth first search with random choices, it backtracks instead of rejecting whole layouts,
+#       the layouts are not exactly uniform
+        fleet, blocked, covered = self.__fleet, 0, 0
+        frames = []
+        placements = []
+        options = self.__options(fleet, blocked, covered)
+        while any(fleet) or self.__hits & ~covered:
+            total = sum(horizontal.bit_count() + vertical.bit_count() for _, horizontal, vertical in options)
+            if not total:
+                if not frames:
+                    raise NoLayoutException
+                options, fleet, blocked, covered = frames.pop()
+                placements.pop()
+                continue
+            choice = self.rng.randrange(total)
+            for number, (index, horizontal, vertical) in enumerate(options):
+                if choice < horizontal.bit_count():
+                    pos, orientation = self.board.nth_set_bit(horizontal, choice), True
+                    options = options[:number] + [(index, horizontal & ~(1 << pos), vertical)] + options[number + 1:]
+                    break
+                choice -= horizontal.bit_count()
+                if choice < vertical.bit_count():
+                    pos, orientation = self.board.nth_set_bit(vertical, choice), False
+                    options = options[:number] + [(index, horizontal, vertical & ~(1 << pos))] + options[number + 1:]
+                    break
+                choice -= vertical.bit_count()
+            frames.append((options, fleet, blocked, covered))
+            length = self.__lengths[index]
+            placements.append((length, pos, orientation))
+            step = 1 if orientation else self.__width
+            for i in range(length):
+                covered |= 1 << (pos + i * step)
+            blocked |= self.board.get_area_mask(pos, length, orientation)
+            fleet = fleet[:index] + (fleet[index] - 1,) + fleet[index + 1:]
+            options = self.__options(fleet, blocked, covered)
+        return self.__make_layout(placements)
+
+    def sample(self):
+        if not self.__possible:
+            raise NoLayoutException
+        if self.exact or self.exact is None and self.__cells <= self.EXACT_CELLS:
+            return self.__sample_exact()
+        return self.__sample_search()
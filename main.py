@@ -1,13 +1,61 @@
-from game_classes import Game
+import os
+import sys
+from time import perf_counter
+
+# the start of the imports of the game, the interpreter start before it is measured by the startup benchmark
+STARTED = perf_counter()
+FLAGS = ('--headless', '--startup-time')
+
+
+def parse_args(argv):
+#   argparse takes longer to import than the game itself, it is only imported for the help and the wrong options
+    if all(arg in FLAGS for arg in argv):
+        return '--headless' in argv, '--startup-time' in argv
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Морской бой")
+    parser.add_argument('--headless', action='store_true',
+                        help="one game with plain text output and no terminal checks, for pipes and test workers")
+    parser.add_argument('--startup-time', action='store_true',
+                        help="report the time from the start of main.py to the first game ready to stderr")
+    args = parser.parse_args(argv)
+    return args.headless, args.startup_time
+
+
+def make_book():
+#   the books are mapped by the first game that needs them, without the directory there is nothing to load
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'books')
+    if not os.path.isdir(directory):
+        return None
+    from book import BookCache
+    return BookCache(directory)
+
+
+def make_renderer(headless):
+    if headless or not sys.stdout.isatty():
+        return None
+    from renderer import DiffRenderer
+    return DiffRenderer()
+
 
 if __name__ == '__main__':
+    headless, startup_time = parse_args(sys.argv[1:])
+    from game_classes import Game
 
+    book = make_book()
     loop_game = True
     while loop_game:
-        game = Game()
-        game.start()
-
-        key = input("Хотите ещё одну игру? (Д, Y - да): ")
+        game = Game(renderer=make_renderer(headless), book=book, plain=headless)
+        if startup_time:
+            print(f"startup: {(perf_counter() - STARTED) * 1000:.1f} ms", file=sys.stderr)
+            startup_time = False
+        try:
+            game.start()
+            if headless:
+                break
+            key = input("Хотите ещё одну игру? (Д, Y - да): ")
+        except EOFError:
+            break
         if key.lower() not in ("y", "д"):
             loop_game = False
 
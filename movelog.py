@@ -0,0 +1,193 @@
+import argparse
+import mmap
+import os
+import struct
+
+from game_classes import HIT_ST, KILL_ST, LOOSE_ST, MISS_ST, Board, Dot
+
+MOVE_LOG_MAGIC = b'BSML'
+MOVE_LOG_VERSION = 1
+# the first record of every game has START_CODE as the result, the board size as x and the board height as y
+# (0 in the logs of the square boards written before the height was recorded)
+START_CODE = 0
+RESULT_CODES = {
+    MISS_ST: 1,
+    HIT_ST: 2,
+    KILL_ST: 3,
+    LOOSE_ST: 4,
+}
+RESULTS = {code: status for status, code in RESULT_CODES.items()}
+
+
+class MoveLogException(Exception):
+    def __init__(self, args="The file is not a move log or has an unknown version!"):
+        Exception.__init__(self, args)
+
+
+class MoveLogWriter:
+#   magic, version, record size
+    HEADER = struct.Struct('<4sBB')
+#   game id, player, x, y, result code
+    RECORD = struct.Struct('<QBhhB')
+#   the index file next to the log: the log size it covers, the largest game id in it and the last record covered,
+#   which tells a log cut or replaced since then
+    INDEX = struct.Struct('<QQ%ds' % RECORD.size)
+    INDEX_SUFFIX = '.max'
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'ab')
+#       the largest game id in the log before it was opened, the drivers numbering their games go on from it
+        self.max_game_id = 0
+#       the last record of the log, None while it has none
+        self.__last = None
+        if self.file.tell() == 0:
+            self.file.write(self.HEADER.pack(MOVE_LOG_MAGIC, MOVE_LOG_VERSION, self.RECORD.size))
+        else:
+            self.max_game_id = self.__find_max_game_id()
+        self.__max_game_id = self.max_game_id
+        self.__index = os.open(path + self.INDEX_SUFFIX, os.O_RDWR | os.O_CREAT, 0o666)
+
+    def __read_index(self, reader):
+#       the number of the records covered by the index file and the largest game id in them, (0, 0) without it
+        try:
+            with open(self.path + self.INDEX_SUFFIX, 'rb') as file:
+                size, max_game_id, last = self.INDEX.unpack(file.read(self.INDEX.size))
+        except (OSError, struct.error):
+            return 0, 0
+        records, rest = divmod(size - self.HEADER.size, self.RECORD.size)
+        if rest or not 0 < records <= len(reader) or reader.raw(records - 1) != last:
+            return 0, 0
+        return records, max_game_id
+
+    def __find_max_game_id(self):
+#       only the records written after the index file are read, all of them if it is missing or stale
+        with MoveLogReader(self.path) as reader:
+            if len(reader):
+                self.__last = reader.raw(len(reader) - 1)
+            records, max_game_id = self.__read_index(reader)
+            return max(max_game_id, max((record[0] for record in reader.iter_from(records)
+                                         if record[4] == START_CODE), default=0))
+
+    def __write_index(self):
+        os.pwrite(self.__index, self.INDEX.pack(self.file.tell(), self.__max_game_id, self.__last), 0)
+
+    def start(self, game_id, board_size, height=None):
+        self.__last = self.RECORD.pack(game_id, 0, board_size, board_size if height is None else height, START_CODE)
+        self.file.write(self.__last)
+#       the index file follows the largest id at once, a log not closed is read in full only if its last records
+#       were lost
+        if game_id > self.__max_game_id:
+            self.__max_game_id = game_id
+            self.__write_index()
+
+    def write(self, game_id, player, dot, result):
+        self.__last = self.RECORD.pack(game_id, player, dot.x, dot.y, RESULT_CODES[result])
+        self.file.write(self.__last)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if self.__last is not None:
+            self.__write_index()
+        self.file.close()
+        os.close(self.__index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class MoveLogReader:
+    HEADER = MoveLogWriter.HEADER
+    RECORD = MoveLogWriter.RECORD
+
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        if size < self.HEADER.size:
+            raise MoveLogException
+#       the records are read straight from the mapped pages, the file is never loaded as a whole
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, record_size = self.HEADER.unpack_from(self.map)
+        if magic != MOVE_LOG_MAGIC or version != MOVE_LOG_VERSION or record_size != self.RECORD.size:
+            raise MoveLogException
+        self.records = (size - self.HEADER.size) // self.RECORD.size
+
+    def __len__(self):
+        return self.records
+
+    def __getitem__(self, index):
+        if not 0 <= index < self.records:
+            raise IndexError("Move log record index out of range")
+        return self.RECORD.unpack_from(self.map, self.HEADER.size + index * self.RECORD.size)
+
+    def raw(self, index):
+        offset = self.HEADER.size + index * self.RECORD.size
+        return self.map[offset:offset + self.RECORD.size]
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def iter_from(self, first):
+        view = memoryview(self.map)[self.HEADER.size + first * self.RECORD.size:
+                                    self.HEADER.size + self.records * self.RECORD.size]
+        try:
+            yield from self.RECORD.iter_unpack(view)
+        finally:
+            view.release()
+
+    def moves(self, game_id):
+        for record in self:
+            if record[0] == game_id:
+                yield record
+
+    def replay(self, game_id, moves=None):
+#       returns {player: Board} with the shots of every player of the game after the first moves
+        boards = {}
+        board_size = height = None
+        made = 0
+        for _, player, x, y, code in self.moves(game_id):
+            if code == START_CODE:
+#               the games logged by other runs under the same id can't be told apart
+                if board_size is not None:
+                    raise MoveLogException(f"There is more than one game {game_id} in the move log!")
+                board_size, height = x, y or x
+                continue
+            if moves is not None and made >= moves:
+                continue
+            if board_size is None:
+                raise MoveLogException("The game has no start record in the move log!")
+            if player not in boards:
+                boards[player] = Board(board_size, height)
+            result = RESULTS[code]
+            boards[player].save_result(Dot(x, y), KILL_ST if result == LOOSE_ST else result)
+            made += 1
+        return boards
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay a game from the move log")
+    parser.add_argument('path')
+    parser.add_argument('--game', type=int, required=True)
+    parser.add_argument('--moves', type=int, default=None, help="number of moves to replay, all by default")
+    args = parser.parse_args()
+
+    with MoveLogReader(args.path) as reader:
+        for player, board in sorted(reader.replay(args.game, args.moves).items()):
+            print(f"\nВыстрелы игрока {player}:")
+            for x in range(board.height):
+                print(' '.join(board[x, y] for y in range(board.width)))
@@ -0,0 +1,72 @@
+import sys
+
+from game_classes import Dot
+
+
+class DiffRenderer:
+#   the frame is laid out as Player.format_board does it: an empty line, the titles, the column numbers
+#   and then the rows, every row is 6 spaces, the row label and a space before the first cell,
+#   the cells are 2 characters apart
+    FIRST_ROW = 4
+    FIRST_COLUMN = 8
+
+    def __init__(self, stream=None):
+        self.stream = stream
+#       per board: the state masks, the last turn and the hid flag of the frame on the screen
+        self.__states = None
+
+    def invalidate(self):
+        self.__states = None
+
+    @staticmethod
+    def __board_state(board):
+        return board.get_row_masks(), board.get_last_turn(), board.hid
+
+    @staticmethod
+    def __changed_dots(board, old_state):
+        old_masks, old_last_turn, old_hid = old_state
+        if old_hid != board.hid:
+            return [Dot(x, y) for x in range(board.height) for y in range(board.width)]
+        dots = set()
+        for status, rows in board.get_row_masks().items():
+            old_rows = old_masks[status]
+            for x in rows.keys() | old_rows.keys():
+                changed = rows.get(x, 0) ^ old_rows.get(x, 0)
+                while changed:
+                    bit = changed & -changed
+                    dots.add(Dot(x, bit.bit_length() - 1))
+                    changed ^= bit
+        if old_last_turn != board.get_last_turn():
+            for dot in (old_last_turn, board.get_last_turn()):
+                if dot is not None:
+                    dots.add(dot)
+        return dots
+
+    def frame(self, player):
+        boards = (player.player_board, player.enemy_board)
+        width = player.player_board.width
+        label_width = player.get_label_width()
+        if self.__states is None:
+#           the board is pinned to the top of the screen and the messages scroll in the lines under it
+            messages_row = self.FIRST_ROW + player.player_board.height + 1
+            text = f"\033[r\033[H\033[2J{player.format_board()}\033[{messages_row}r\033[{messages_row};1H"
+        else:
+            parts = ["\0337"]
+            for number, board in enumerate(boards):
+                column = self.FIRST_COLUMN + label_width + number * (2 * width + 2 * label_width + 6)
+                for dot in self.__changed_dots(board, self.__states[number]):
+                    parts.append(f"\033[{self.FIRST_ROW + dot.x};{column + 2 * dot.y}H{board[dot]}")
+            parts.append("\0338")
+            text = ''.join(parts)
+        self.__states = [self.__board_state(board) for board in boards]
+        return text
+
+    def reset(self):
+#       gives the whole screen back to the scrolling text
+        self.invalidate()
+        return "\033[r"
+
+    def render(self, player):
+        stream = self.stream if self.stream is not None else sys.stdout
+        stream.write(self.frame(player) + "\n")
+        stream.flush()
@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from book import BookCache
+from events import EventHub, JsonLinesWriter
+from game_classes import BOARD_SIZE, CALL_REQ, EVENT_REQ, INPUT_REQ, OUTPUT_REQ, RENDER_REQ, Game
+from instruments import Instruments
+from movelog import MoveLogWriter
+from renderer import DiffRenderer
+
+
+class ConnectionClosedException(Exception):
+    def __init__(self, args="The client has closed the connection!"):
+        Exception.__init__(self, args)
+
+
+class Session:
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+
+    async def output(self, text):
+        self.writer.write((text + "\n").encode())
+        await self.writer.drain()
+
+    async def input(self, prompt):
+        self.writer.write(prompt.encode())
+        await self.writer.drain()
+        line = await self.reader.readline()
+        if not line:
+            raise ConnectionClosedException
+        return line.decode(errors='replace').strip()
+
+    async def drive(self, steps):
+        reply = None
+        while True:
+            try:
+                request, payload = steps.send(reply)
+            except StopIteration as stop:
+                return stop.value
+            if request == INPUT_REQ:
+                reply = await self.input(payload)
+            elif request == OUTPUT_REQ:
+                await self.output(payload)
+                reply = None
+            elif request == RENDER_REQ:
+                await self.output(payload())
+                reply = None
+            elif request == CALL_REQ:
+                reply = await self.server.call(payload)
+            elif request == EVENT_REQ:
+                reply = None
+                if self.server.events is not None:
+                    await self.server.events.publish_async(payload)
+
+    async def run(self):
+        loop_game = True
+        while loop_game:
+            game = Game(self.server.board_size, self.server.strategy, self.server.time_budget,
+                        self.server.move_log, self.server.next_game_id(),
+                        DiffRenderer() if self.server.diff_render else None, self.server.height,
+                        book=self.server.book, executor=self.server.executor if self.server.speculate else None)
+            try:
+                if self.server.instruments is None:
+                    await self.drive(game.start_steps())
+                else:
+                    instruments = Instruments()
+                    instruments.attach_game(game)
+                    try:
+                        await self.drive(game.start_steps())
+                    finally:
+                        instruments.detach()
+                        self.server.instruments.merge(instruments)
+            finally:
+#               the move computed ahead is not needed when the client is gone
+                game.ai.cancel_speculation()
+
+            key = await self.input("Хотите ещё одну игру? (Д, Y - да): ")
+            if key.lower() not in ("y", "д"):
+                loop_game = False
+
+        await self.output("Игра завершена.\nУдачи!")
+
+
+class GameServer:
+#   these strategies answer in microseconds, the others are run in the worker threads
+    CHEAP_STRATEGIES = ('random', 'hunt', 'parity')
+
+    def __init__(self, board_size=BOARD_SIZE, strategy='hunt', time_budget=None, workers=None, move_log=None,
+                 diff_render=False, height=None, instrument=False, books=None, events=None, speculate=False):
+        self.board_size = board_size
+        self.height = height
+        self.strategy = strategy
+        self.time_budget = time_budget
+        self.offload = strategy not in self.CHEAP_STRATEGIES or time_budget is not None
+        self.executor = ThreadPoolExecutor(max_workers=workers) if self.offload else None
+#       the AI moves are computed in the workers while the users think, the cheap strategies aren't worth it
+        self.speculate = speculate and self.offload
+        self.sessions = 0
+        self.move_log = MoveLogWriter(move_log) if move_log is not None else None
+#       the ids go on from the games the log has from the earlier runs
+        self.games = self.move_log.max_game_id if self.move_log is not None else 0
+        self.diff_render = diff_render
+#       the counters and timings of all the games played, every game is measured on its own and merged here
+        self.instruments = Instruments() if instrument else None
+        self.book = BookCache(books) if books is not None else None
+#       events.EventHub getting the events of all the games, a session waits while an async consumer is behind
+        self.events = events
+
+    def next_game_id(self):
+        self.games += 1
+        return self.games
+
+    async def call(self, function):
+        if self.offload:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function)
+        return function()
+
+    async def handle(self, reader, writer):
+        self.sessions += 1
+        try:
+            await Session(self, reader, writer).run()
+        except (ConnectionClosedException, ConnectionError):
+            pass
+        finally:
+            self.sessions -= 1
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8023, path=None):
+        if path is None:
+            server = await asyncio.start_server(self.handle, host, port)
+        else:
+            server = await asyncio.start_unix_server(self.handle, path)
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Battleships game server, one game per connection")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8023)
+    parser.add_argument('--unix', metavar='PATH', default=None, help="listen on a local socket instead of TCP")
+    parser.add_argument('--board-size', type=int, default=BOARD_SIZE)
+    parser.add_argument('--height', type=int, default=None, help="number of rows, the board is square by default")
+    parser.add_argument('--strategy', default='hunt')
+    parser.add_argument('--time-budget', type=float, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--move-log', metavar='PATH', default=None, help="append every move to this log")
+    parser.add_argument('--diff-render', action='store_true',
+                        help="redraw only the changed cells, the clients must be ANSI terminals")
+    parser.add_argument('--instrument', action='store_true',
+                        help="measure the shots, moves and fleet placements, print the stats on exit")
+    parser.add_argument('--books', metavar='DIR', default=None, help="take the fleets and AI openings from the books")
+    parser.add_argument('--event-log', metavar='PATH', default=None,
+                        help="append the events of all the games to this file as JSON lines")
+    parser.add_argument('--speculate', action='store_true',
+                        help="compute the AI moves while the users think, for the strategies run in the workers")
+    args = parser.parse_args()
+
+    event_log = open(args.event_log, 'a') if args.event_log is not None else None
+    events = EventHub([JsonLinesWriter(event_log)]) if event_log is not None else None
+    game_server = GameServer(args.board_size, args.strategy, args.time_budget, args.workers, args.move_log,
+                             args.diff_render, args.height, args.instrument, args.books, events, args.speculate)
+    try:
+        asyncio.run(game_server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    if game_server.move_log is not None:
+        game_server.move_log.close()
+    if event_log is not None:
+        event_log.close()
+    if game_server.instruments is not None:
+        print(game_server.instruments.report())
@@ -0,0 +1,73 @@
+from collections import namedtuple
+from random import Random
+
+from game_classes import BOARD_SIZE, FLEET, HIT_ST, KILL_ST, LOOSE_ST, MISS_ST, OCCUPIED_ST, OUT_ST, Ai, Game, split_rng
+from strategies import get_strategy
+
+# winner - index of the winning player in Simulator.players,
+# shots and hits - pairs of per player counters
+GameResult = namedtuple('GameResult', ['seed', 'winner', 'turns', 'shots', 'hits'])
+
+
+class SimulationError(Exception):
+    def __init__(self, args="The player keeps shooting at the used dots or outside the board!"):
+        Exception.__init__(self, args)
+
+
+class Simulator:
+    MAX_RETRIES = 1000
+
+    def __init__(self, players=(Ai, Ai), board_size=BOARD_SIZE, fleet=FLEET, move_log=None, height=None):
+#       players are Player subclasses or names of the AI strategies, the Ai ones are told the fleet they shoot at
+        self.players = tuple(get_strategy(player) if isinstance(player, str) else player for player in players)
+        self.board_size = board_size
+        self.height = height
+        self.fleet = tuple(fleet)
+#       movelog.MoveLogWriter, the games are logged with their seeds as ids and players numbered from 1
+        self.move_log = move_log
+
+    def __make_player(self, player_class, rng):
+        if isinstance(player_class, type) and not issubclass(player_class, Ai):
+            return player_class(self.board_size, height=self.height, rng=rng)
+        return player_class(self.board_size, height=self.height, rng=rng, fleet=self.fleet)
+
+    def play(self, seed):
+#       the seed alone determines the game, whatever process plays it and whatever was played there before
+        rngs = split_rng(Random(seed), len(self.players))
+        players = [self.__make_player(player_class, rng) for player_class, rng in zip(self.players, rngs)]
+        for player in players:
+            player.add_ships_random(Game.make_ships(self.fleet))
+        if self.move_log is not None:
+            self.move_log.start(seed, self.board_size, self.height)
+
+        turns = 1
+        shots = [0, 0]
+        hits = [0, 0]
+        current = 0
+        while True:
+            player, enemy = players[current], players[1 - current]
+            result = HIT_ST
+            while result in (HIT_ST, KILL_ST):
+                dot = player.ask()
+                result = enemy.move(dot)
+                retries = 0
+                while result in (OCCUPIED_ST, OUT_ST):
+                    retries += 1
+                    if retries > self.MAX_RETRIES:
+                        raise SimulationError
+                    dot = player.ask()
+                    result = enemy.move(dot)
+                player.save_move(dot, result)
+                if self.move_log is not None:
+                    self.move_log.write(seed, current + 1, dot, result)
+                shots[current] += 1
+                if result != MISS_ST:
+                    hits[current] += 1
+                if result == LOOSE_ST:
+                    return GameResult(seed, current, turns, tuple(shots), tuple(hits))
+            current = 1 - current
+            turns += 1
+
+    def run(self, games, seed=0):
+        for game_seed in range(seed, seed + games):
+            yield self.play(game_seed)
@@ -0,0 +1,236 @@
+from collections import Counter
+
+from game_classes import BOARD_SIZE, FLEET, KILL_ST, LOOSE_ST, Ai, Board, Dot
+
+
+class UnknownStrategyException(Exception):
+    def __init__(self, args="There is no AI strategy with this name!"):
+        Exception.__init__(self, args)
+
+
+class RandomAi(Ai):
+    BATCH = 64
+
+    def __init__(self, board_size=BOARD_SIZE, time_budget=None, height=None, rng=None, fleet=FLEET):
+        Ai.__init__(self, board_size, time_budget, height, rng, fleet)
+#       the next shots drawn at once, the ones no longer free are skipped, the first free one is still
+#       uniformly random among all the free cells
+        self.__queue = []
+
+    def restore(self):
+        self.__queue = []
+
+    def candidates(self):
+        while self.__queue:
+            dot = self.__queue.pop()
+            if self.enemy_board.is_free(dot):
+                yield dot
+                return
+        self.__queue = self.enemy_board.sample_free_dots(self.BATCH)
+        yield self.__queue.pop() if self.__queue else None
+
+
+class ParityAi(Ai):
+    def __init__(self, board_size=BOARD_SIZE, time_budget=None, height=None, rng=None, fleet=FLEET):
+        Ai.__init__(self, board_size, time_budget, height, rng, fleet)
+
+    def get_parity(self):
+#       every ship left covers at least one cell of each diagonal stripe of the shortest one's length
+        remaining = Counter(self.fleet)
+        for ship in self.enemy_board.ships:
+            if ship.lives == 0:
+                remaining[ship.length] -= 1
+        return min((length for length, count in remaining.items() if count > 0), default=1)
+
+    def candidates(self):
+        edges = self.enemy_board.get_ships_edges()
+        if edges:
+            yield edges[self.rng.randrange(len(edges))]
+            return
+        parity = self.get_parity()
+        if parity > 1:
+            dots = [dot for dot in self.enemy_board.get_free_dots() if (dot.x + dot.y) % parity == 0]
+            if dots:
+                yield dots[self.rng.randrange(len(dots))]
+                return
+        yield self.enemy_board.get_random_free_dot()
+
+
+class DensityAi(Ai):
+    SCAN_CHUNK = 256
+
+    def __init__(self, board_size=BOARD_SIZE, time_budget=None, height=None, rng=None, fleet=FLEET):
+        Ai.__init__(self, board_size, time_budget, height, rng, fleet)
+        self.__width = self.enemy_board.width
+        self.__height = self.enemy_board.height
+        self.__reset()
+
+    def __reset(self):
+#       the heat of a cell is worked out when asked for from the placements covering it on the empty board,
+#       only the placements lost to the blocked cells are kept, so no step walks over the whole board
+        self.__remaining = Counter(self.fleet)
+        self.__free = bytearray(b'\x01') * (self.__width * self.__height)
+#       length -> the numbers of the placements of a ship of this length covering a cell of every column
+#       and of every row of the empty board, the heat of the cell starts from their sum
+        self.__line_counts = {length: ([self.__count_placements(y, self.__width, length) for y in range(self.__width)],
+                                       [self.__count_placements(x, self.__height, length) if length > 1 else 0
+                                        for x in range(self.__height)])
+                              for length in self.__remaining}
+#       length -> cell -> the number of the placements of a ship of this length covering the cell that are
+#       no longer free
+        self.__lost = {length: Counter() for length in self.__remaining}
+
+    def restore(self):
+        self.__reset()
+        for ship in self.enemy_board.ships:
+            if ship.lives == 0:
+                self.__kill(ship.length)
+        blocked = ((1 << len(self.__free)) - 1) & ~self.enemy_board.get_free_mask()
+        for cell in Board.iter_set_bits(blocked):
+            self.__block(cell)
+
+    def __get_heat(self, cell):
+        x, y = divmod(cell, self.__width)
+        heat = 0
+        for length, count in self.__remaining.items():
+            columns, rows = self.__line_counts[length]
+            heat += count * (columns[y] + rows[x] - self.__lost[length][cell])
+        return heat
+
+    def get_heat(self, dot):
+        return self.__get_heat(dot.x * self.__width + dot.y)
+
+    def get_remaining_fleet(self):
+        return sorted(self.__remaining.elements(), reverse=True)
+
+    def __placements(self, cell, length):
+        width = self.__width
+        x, y = divmod(cell, width)
+        for start in range(max(0, y - length + 1), min(y, width - length) + 1):
+            yield range(x * width + start, x * width + start + length)
+        if length > 1:
+            for start in range(max(0, x - length + 1), min(x, self.__height - length) + 1):
+                yield range(start * width + y, (start + length) * width + y, width)
+
+    @staticmethod
+    def __count_placements(position, size, length):
+#       the placements along a line covering the cell start from max(0, position - length + 1)
+#       up to min(position, size - length)
+        return max(0, min(position, size - length) - max(0, position - length + 1) + 1)
+
+    def __block(self, cell):
+        if not self.__free[cell]:
+            return
+        for length, lost in self.__lost.items():
+            for placement in self.__placements(cell, length):
+                if all(self.__free[covered] for covered in placement):
+                    for covered in placement:
+                        lost[covered] += 1
+        self.__free[cell] = 0
+
+    def __kill(self, length):
+        if self.__remaining[length] > 0:
+            self.__remaining[length] -= 1
+            if self.__remaining[length] == 0:
+                del self.__remaining[length]
+                del self.__lost[length]
+                del self.__line_counts[length]
+
+    def save_move(self, dot, status):
+#       the board tells the cells the shot made known, the heat follows its free cells
+        blocked = Ai.save_move(self, dot, status)
+        if status in (KILL_ST, LOOSE_ST):
+            self.__kill(self.enemy_board.get_ship(dot).length)
+        for cell in Board.iter_set_bits(blocked):
+            self.__block(cell)
+        return blocked
+
+    def __best(self, cells):
+        heats = [self.__get_heat(cell) for cell in cells]
+        best_heat = max(heats)
+        best = [cell for cell, heat in zip(cells, heats) if heat == best_heat]
+        return best[self.rng.randrange(len(best))], best_heat
+
+    def candidates(self):
+        edges = self.enemy_board.get_ships_edges()
+        if edges:
+            cell, _ = self.__best([edge.x * self.__width + edge.y for edge in edges])
+            yield Dot(*divmod(cell, self.__width))
+            return
+#       a random free cell first, then the hottest cell of the part of the board scanned so far
+        yield self.enemy_board.get_random_free_dot()
+        best_cell, best_heat = None, 0
+        for chunk in range(0, len(self.__free), self.SCAN_CHUNK):
+            cells = [cell for cell in range(chunk, min(chunk + self.SCAN_CHUNK, len(self.__free))) if self.__free[cell]]
+            if cells:
+                cell, heat = self.__best(cells)
+                if heat > best_heat:
+                    best_cell, best_heat = cell, heat
+#           yielded after every chunk, so ask() checks the time budget while the board is scanned
+            yield Dot(*divmod(best_cell, self.__width)) if best_cell is not None else None
+
+
+class SamplingAi(Ai):
+    MAX_SAMPLES = 200
+
+    def __init__(self, board_size=BOARD_SIZE, time_budget=None, height=None, rng=None, fleet=FLEET):
+        Ai.__init__(self, board_size, time_budget, height, rng, fleet)
+
+    def candidates(self):
+#       hunt/target move first, then the cell taken by a ship in most of the fleet layouts sampled so far;
+#       the exact count behind the uniform samples takes longer than a move may, so a move in the time budget
+#       samples with the search
+        from layouts import LayoutCounter, NoLayoutException
+
+        yield from Ai.candidates(self)
+        counter = LayoutCounter(self.enemy_board, self.fleet, exact=False if self.time_budget is not None else None)
+        hits = Counter()
+        for _ in range(self.MAX_SAMPLES):
+            try:
+                layout = counter.sample()
+            except NoLayoutException:
+                return
+            for ship in layout:
+                for dot in ship.dots():
+                    if not self.enemy_board.is_shot(dot):
+                        hits[dot] += 1
+            if hits:
+                yield hits.most_common(1)[0][0]
+
+
+class EndgameAi(Ai):
+    def __init__(self, board_size=BOARD_SIZE, time_budget=None, height=None, rng=None, fleet=FLEET):
+        Ai.__init__(self, board_size, time_budget, height, rng, fleet)
+        from endgame import EndgameSolver
+        self.solver = EndgameSolver()
+
+    def candidates(self):
+#       the hunt/target move first, then the exact endgame move once the layouts of the ships left are few
+        yield from Ai.candidates(self)
+        dot = self.solver.best_shot(self.enemy_board, self.fleet, self.deadline)
+        if dot is not None:
+            yield dot
+
+
+STRATEGIES = {
+    'random': RandomAi,
+    'hunt': Ai,
+    'parity': ParityAi,
+    'density': DensityAi,
+    'sampling': SamplingAi,
+    'endgame': EndgameAi,
+}
+
+
+def register_strategy(name, ai_class):
+    STRATEGIES[name] = ai_class
+
+
+def get_strategy(name):
+    if name not in STRATEGIES:
+        raise UnknownStrategyException(f"Unknown AI strategy '{name}', available: {', '.join(STRATEGIES)}")
+    return STRATEGIES[name]
+
+
+def make_ai(name='hunt', board_size=BOARD_SIZE, time_budget=None, height=None, rng=None, fleet=FLEET):
+    return get_strategy(name)(board_size, time_budget, height, rng, fleet)
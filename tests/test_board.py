@@ -0,0 +1,77 @@
+from game_classes import HIT_ST, KILL_ST, MISS_ST, SHIP_ST, SNAPSHOT_MAGIC, Board, Game, RowMask
+
+
+def play(game, shots):
+    for _ in range(shots):
+        dot = game.ai.ask()
+        game.ai.save_move(dot, game.user.player_board.shot(dot))
+        dot = game.user.enemy_board.get_random_free_dot()
+        game.user.enemy_board.save_result(dot, game.ai.player_board.shot(dot))
+
+
+def make_game(board_size, height=None, shots=20):
+    game = Game(board_size, height=height, seed=3)
+    game.user.add_ships_random(Game.make_ships())
+    game.ai.add_ships_random(Game.make_ships())
+    play(game, shots)
+    return game
+
+
+def dump_version_2(game):
+#   the boards of the version 2 snapshots have the masks of the whole board
+    strategy = game.strategy.encode()
+    data = [Game.SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, 2, game.board_size, game.height, game.get_current_player(),
+                                      float('nan'), len(strategy)), strategy]
+    for board in (game.user.player_board, game.user.enemy_board, game.ai.player_board, game.ai.enemy_board):
+        last_turn = board.get_last_turn()
+        data.append(Board.SNAPSHOT_HEADER.pack(board.hid, last_turn.x if last_turn else -1,
+                                               last_turn.y if last_turn else -1, board.alive_ships, len(board.ships)))
+        masks = board.get_masks()
+        for status in (SHIP_ST, MISS_ST, HIT_ST, KILL_ST):
+            data.append(masks[status].to_bytes((board.width * board.height + 7) // 8, 'little'))
+        for ship in board.ships:
+            data.append(Board.SNAPSHOT_SHIP.pack(ship.start_point.x, ship.start_point.y, ship.length,
+                                                 bool(ship.orientation), ship.lives))
+    return b''.join(data)
+
+
+def test_row_mask_keeps_the_set_rows_only():
+    mask = (1 << 3) | (1 << (7 * 10 + 9)) | (1 << (999 * 10))
+    rows = RowMask.from_int(mask, 10)
+    assert rows.rows == {0: 1 << 3, 7: 1 << 9, 999: 1}
+    assert rows.to_int(10) == mask
+    assert rows.count() == 3
+
+
+def test_snapshot_of_a_large_board_follows_the_shots():
+    game = make_game(1000)
+    data = game.dump()
+    assert len(data) < 100000
+    loaded = Game.load(data)
+    for old, new in ((game.user, loaded.user), (game.ai, loaded.ai)):
+        for board, loaded_board in ((old.player_board, new.player_board), (old.enemy_board, new.enemy_board)):
+            assert loaded_board.get_row_masks() == board.get_row_masks()
+            assert loaded_board.get_free_count() == board.get_free_count()
+
+
+def test_version_2_snapshot_loads():
+    game = make_game(9, 7)
+    loaded = Game.load(dump_version_2(game))
+    assert loaded.user.format_board() == game.user.format_board()
+    assert loaded.dump() == game.dump()
+
+
+def test_row_symbols_match_the_cells():
+    game = make_game(12, 10, 40)
+    for board in (game.user.player_board, game.user.enemy_board):
+        for x in range(board.height):
+            assert board.get_row_symbols(x) == [board[x, y] for y in range(board.width)]
+
+
+def test_free_dots_follow_the_blocked_cells():
+    board = make_game(30, 20, 60).ai.enemy_board
+    free = board.get_free_mask()
+    dots = board.get_free_dots()
+    assert len(dots) == board.get_free_count() == free.bit_count()
+    assert all(free >> (dot.x * board.width + dot.y) & 1 for dot in dots)
+    assert all(board.is_free(dot) for dot in board.sample_free_dots(50))
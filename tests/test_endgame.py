@@ -0,0 +1,32 @@
+from time import perf_counter
+
+from endgame import EndgameSolver, TranspositionTable, ZobristKeys, get_layouts
+from game_classes import HIT_ST, Board, Dot
+
+
+def make_wounded_board():
+#   4x4, a ship wounded at (0, 0) and (0, 1), the 3 and the 2 deck ships left
+    board = Board(4)
+    board.save_result(Dot(0, 0), HIT_ST)
+    board.save_result(Dot(0, 1), HIT_ST)
+    return board
+
+
+def test_layouts_have_no_ship_on_hits_only():
+    board = make_wounded_board()
+    hits = board.get_masks()[HIT_ST]
+    layouts = get_layouts(board, [3, 2], 100)
+    assert len(layouts) == 10
+    for layout in layouts:
+        assert len(layout) == 2
+        assert all(ship & ~hits for ship in layout)
+
+
+def test_best_shot_finishes_the_wounded_ship():
+    solver = EndgameSolver(TranspositionTable(), ZobristKeys())
+    assert solver.best_shot(make_wounded_board(), (3, 2)) == Dot(0, 2)
+
+
+def test_best_shot_gives_up_after_the_deadline():
+    solver = EndgameSolver(TranspositionTable(), ZobristKeys())
+    assert solver.best_shot(make_wounded_board(), (3, 2), perf_counter() - 1) is None
@@ -0,0 +1,89 @@
+from itertools import combinations
+from random import Random
+
+from game_classes import HIT_ST, MISS_ST, Board, Dot, Game, Player
+from layouts import LayoutCounter
+
+
+def brute_force_count(board, fleet):
+#   every set of ships of the fleet with no common areas, out of the misses, covering every hit
+#   and having a cell out of the hits each
+    masks = board.get_masks()
+    hits, misses = masks[HIT_ST], masks[MISS_ST]
+    placements = {}
+    for length in set(fleet):
+        placements[length] = []
+        for orientation, starts in zip((True, False), board.get_start_masks(length, 0)):
+            for start in Board.iter_set_bits(starts):
+                cells = 0
+                for i in range(length):
+                    cells |= 1 << (start + (i if orientation else i * board.width))
+                if not cells & misses and cells & ~hits:
+                    placements[length].append((cells, board.get_area_mask(start, length, orientation)))
+
+    def count(lengths, blocked, covered):
+        if not lengths:
+            return 1 if not hits & ~covered else 0
+        length = lengths[0]
+        number = lengths.count(length)
+        total = 0
+        for chosen in combinations(placements[length], number):
+            areas = blocked
+            cells = covered
+            for ship, area in chosen:
+                if ship & areas:
+                    break
+                areas |= area
+                cells |= ship
+            else:
+                total += count(lengths[number:], areas, cells)
+        return total
+
+    return count(sorted(fleet, reverse=True), 0, 0)
+
+
+def test_count_skips_ships_on_hits_only():
+    board = Board(5, 4)
+    board.save_result(Dot(0, 2), MISS_ST)
+    board.save_result(Dot(1, 2), HIT_ST)
+    assert brute_force_count(board, (3, 2, 1, 1)) == 110
+    assert LayoutCounter(board, (3, 2, 1, 1)).count() == 110
+
+
+def test_count_matches_brute_force():
+#   misses and hits of the shots at a hidden fleet, the shots killing a ship are left out
+    fleet = (3, 2, 1, 1)
+    for seed in range(20):
+        player = Player(5, 4, Random(seed))
+        player.add_ships_random(Game.make_ships(fleet))
+        hidden = player.player_board
+        board = Board(5, 4)
+        for dot in player.rng.sample([Dot(x, y) for x in range(4) for y in range(5)], 6):
+            ship = hidden.get_ship(dot)
+            if ship is None:
+                board.save_result(dot, MISS_ST)
+            elif ship.length > 1 and sum(board.is_shot(cell) for cell in ship.dots()) < ship.length - 1:
+                board.save_result(dot, HIT_ST)
+        assert LayoutCounter(board, fleet).count() == brute_force_count(board, fleet)
+
+
+def test_samples_have_no_ship_on_hits_only():
+    board = Board(5, 4)
+    board.save_result(Dot(0, 2), MISS_ST)
+    board.save_result(Dot(1, 2), HIT_ST)
+    hits = board.get_masks()[HIT_ST]
+    counter = LayoutCounter(board, (3, 2, 1, 1), rng=Random(0))
+    for _ in range(200):
+        for ship in counter.sample():
+            assert any(not hits >> (dot.x * board.width + dot.y) & 1 for dot in ship.dots())
+
+
+def test_search_samples_have_no_ship_on_hits_only():
+    board = Board(8)
+    board.save_result(Dot(3, 3), HIT_ST)
+    board.save_result(Dot(3, 4), MISS_ST)
+    hits = board.get_masks()[HIT_ST]
+    counter = LayoutCounter(board, (4, 3, 2, 1, 1), rng=Random(0))
+    for _ in range(200):
+        for ship in counter.sample():
+            assert any(not hits >> (dot.x * board.width + dot.y) & 1 for dot in ship.dots())
@@ -0,0 +1,52 @@
+import os
+
+from game_classes import MISS_ST, Dot
+from movelog import MoveLogReader, MoveLogWriter
+
+
+def write_games(path, game_ids):
+    with MoveLogWriter(path) as writer:
+        for game_id in game_ids:
+            writer.start(game_id, 10)
+            writer.write(game_id, 1, Dot(0, 0), MISS_ST)
+
+
+def test_reopened_log_goes_on_from_largest_id(tmp_path):
+    path = str(tmp_path / 'moves.log')
+    write_games(path, [3, 7, 5])
+    write_games(path, [8, 2])
+    with MoveLogWriter(path) as writer:
+        assert writer.max_game_id == 8
+    with MoveLogReader(path) as reader:
+        assert len(reader) == 10
+
+
+def test_log_without_index_is_read_in_full(tmp_path):
+    path = str(tmp_path / 'moves.log')
+    write_games(path, [4, 9, 6])
+    os.remove(path + MoveLogWriter.INDEX_SUFFIX)
+    with MoveLogWriter(path) as writer:
+        assert writer.max_game_id == 9
+
+
+def test_stale_index_is_not_trusted(tmp_path):
+    path = str(tmp_path / 'moves.log')
+    write_games(path, [12])
+    index = open(path + MoveLogWriter.INDEX_SUFFIX, 'rb').read()
+#   the log is replaced by another one of the same size
+    os.remove(path)
+    write_games(path, [2])
+    open(path + MoveLogWriter.INDEX_SUFFIX, 'wb').write(index)
+    with MoveLogWriter(path) as writer:
+        assert writer.max_game_id == 2
+
+
+def test_records_after_index_are_read(tmp_path):
+    path = str(tmp_path / 'moves.log')
+    write_games(path, [5])
+    index = open(path + MoveLogWriter.INDEX_SUFFIX, 'rb').read()
+    write_games(path, [11, 6])
+#   the index of an earlier run, as if the last one was killed before writing its own
+    open(path + MoveLogWriter.INDEX_SUFFIX, 'wb').write(index)
+    with MoveLogWriter(path) as writer:
+        assert writer.max_game_id == 11
@@ -0,0 +1,36 @@
+from random import Random
+
+import pytest
+
+from game_classes import Board, Game, Player, ShipWrongPosition
+
+DENSE_FLEETS = [
+    (8, (4, 3, 3, 2, 2, 2, 1, 1, 1, 1)),
+    (8, (3, 3, 2, 2, 2, 2, 1, 1, 1, 1, 1, 1)),
+    (7, (3, 2, 2, 2, 1, 1, 1, 1, 1)),
+    (7, (4, 3, 3, 2, 2, 2, 1, 1, 1, 1)),
+]
+
+
+def place(board_size, fleet, seed):
+    player = Player(board_size, rng=Random(seed))
+    player.add_ships_random(Game.make_ships(fleet))
+    return player
+
+
+@pytest.mark.parametrize('board_size, fleet', DENSE_FLEETS)
+def test_dense_fleet_is_placed_with_every_seed(board_size, fleet):
+    for seed in range(30):
+        board = place(board_size, fleet, seed).player_board
+        assert sorted(ship.length for ship in board.ships) == sorted(fleet)
+#       the ships don't touch each other
+        check = Board(board_size)
+        for ship in board.ships:
+            assert check.try_ship(ship)
+            check.add_ship(ship)
+
+
+@pytest.mark.parametrize('board_size, fleet', [(6, (1,) * 10), (6, (3, 2, 2, 2, 1, 1, 1, 1, 1)), (8, (1,) * 17)])
+def test_fleet_with_no_layout_raises(board_size, fleet):
+    with pytest.raises(ShipWrongPosition):
+        place(board_size, fleet, 0)
@@ -0,0 +1,61 @@
+from random import Random
+
+from game_classes import Ai, Dot, Game, Player
+from simulator import Simulator
+from strategies import STRATEGIES, DensityAi, make_ai, register_strategy
+
+
+class RandomPlayer(Player):
+    def ask(self):
+        return self.enemy_board.get_random_free_dot()
+
+
+def test_strategies_take_the_same_parameters():
+    for name in STRATEGIES:
+        ai = make_ai(name, 7, 0.5, 5, Random(0), (3, 1))
+        assert (ai.enemy_board.width, ai.enemy_board.height) == (7, 5)
+        assert ai.time_budget == 0.5
+        assert ai.fleet == (3, 1)
+
+
+def test_game_takes_registered_hunt_strategy():
+    class HuntAi(Ai):
+        pass
+
+    assert type(Game(6).ai) is Ai
+    register_strategy('hunt', HuntAi)
+    try:
+        assert type(Game(6).ai) is HuntAi
+    finally:
+        register_strategy('hunt', Ai)
+
+
+def test_simulator_plays_any_player_subclass():
+    result = Simulator((Ai, RandomPlayer)).play(1)
+    assert result.winner in (0, 1)
+
+
+def brute_force_heat(ai, dot):
+    board = ai.enemy_board
+    heat = 0
+    for length in set(ai.get_remaining_fleet()):
+        count = ai.get_remaining_fleet().count(length)
+        for orientation in ((True, False) if length > 1 else (True,)):
+            for shift in range(length):
+                start = (dot.x, dot.y - shift) if orientation else (dot.x - shift, dot.y)
+                cells = [Dot(start[0], start[1] + i) if orientation else Dot(start[0] + i, start[1])
+                         for i in range(length)]
+                if all(not board.out(cell) and board.is_free(cell) for cell in cells):
+                    heat += count
+    return heat
+
+
+def test_density_heat_counts_the_free_placements():
+    ai = DensityAi(7, height=5, rng=Random(3))
+    target = Ai(7, height=5, rng=Random(4))
+    target.add_ships_random(Game.make_ships())
+    for _ in range(15):
+        dot = ai.ask()
+        ai.save_move(dot, target.move(dot))
+    for dot in ai.enemy_board.get_free_dots():
+        assert ai.get_heat(dot) == brute_force_heat(ai, dot)
@@ -0,0 +1,125 @@
+import argparse
+import math
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from batch import BatchSimulator
+from game_classes import BOARD_SIZE, FLEET, Ai
+from simulator import Simulator
+
+
+class TournamentStats:
+    def __init__(self):
+        self.games = 0
+        self.wins = [0, 0]
+#       winner's shots -> number of games, merges exactly and gives exact percentiles
+        self.shots_to_win = Counter()
+        self.elapsed = 0.0
+
+    def add(self, result):
+        self.games += 1
+        self.wins[result.winner] += 1
+        self.shots_to_win[result.shots[result.winner]] += 1
+
+    def merge(self, other):
+        self.games += other.games
+        self.wins = [a + b for a, b in zip(self.wins, other.wins)]
+        self.shots_to_win.update(other.shots_to_win)
+        return self
+
+    def win_rate(self, player=0):
+        return self.wins[player] / self.games if self.games else 0.0
+
+    def mean_shots_to_win(self):
+        if not self.games:
+            return 0.0
+        return sum(shots * count for shots, count in self.shots_to_win.items()) / self.games
+
+    def percentile_shots_to_win(self, percent):
+        if not self.games:
+            return 0
+        rank = max(1, math.ceil(percent / 100 * self.games))
+        seen = 0
+        for shots in sorted(self.shots_to_win):
+            seen += self.shots_to_win[shots]
+            if seen >= rank:
+                return shots
+
+    def games_per_second(self):
+        return self.games / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return {
+            'games': self.games,
+            'win_rate': [self.win_rate(0), self.win_rate(1)],
+            'mean_shots_to_win': self.mean_shots_to_win(),
+            'p50_shots_to_win': self.percentile_shots_to_win(50),
+            'p90_shots_to_win': self.percentile_shots_to_win(90),
+            'p99_shots_to_win': self.percentile_shots_to_win(99),
+            'games_per_second': self.games_per_second(),
+        }
+
+
+def play_chunk(players, board_size, fleet, seed, games, height=None, batch=False):
+    stats = TournamentStats()
+    start = time.perf_counter()
+    if batch:
+        simulator = BatchSimulator(board_size, fleet, height)
+    else:
+        simulator = Simulator(players, board_size, fleet, height=height)
+    for result in simulator.run(games, seed):
+        stats.add(result)
+    stats.elapsed = time.perf_counter() - start
+    return stats
+
+
+class Tournament:
+    def __init__(self, players=(Ai, Ai), board_size=BOARD_SIZE, fleet=FLEET, workers=None, chunk_size=1000,
+                 height=None, batch=False):
+        self.players = tuple(players)
+        self.board_size = board_size
+        self.height = height
+#       the games are played by BatchSimulator, hunt against hunt only
+        self.batch = batch
+        self.fleet = tuple(fleet)
+        self.workers = workers
+        self.chunk_size = chunk_size
+
+    def chunks(self, games, seed=0):
+#       every chunk is a fixed range of game seeds, so the results don't depend
+#       on the number of workers or on the order the chunks are finished in
+        for chunk_seed in range(seed, seed + games, self.chunk_size):
+            yield chunk_seed, min(self.chunk_size, seed + games - chunk_seed)
+
+    def run(self, games, seed=0):
+        stats = TournamentStats()
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(play_chunk, self.players, self.board_size, self.fleet, chunk_seed, count,
+                                       self.height, self.batch)
+                       for chunk_seed, count in self.chunks(games, seed)]
+            for future in futures:
+                stats.merge(future.result())
+        stats.elapsed = time.perf_counter() - start
+        return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Ai vs Ai tournament")
+    parser.add_argument('--games', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--board-size', type=int, default=BOARD_SIZE)
+    parser.add_argument('--height', type=int, default=None, help="number of rows, the board is square by default")
+    parser.add_argument('--players', nargs=2, default=['hunt', 'hunt'], metavar='STRATEGY')
+    parser.add_argument('--batch', action='store_true', help="play the games in lockstep batches, hunt vs hunt only")
+    args = parser.parse_args()
+    if args.batch and args.players != ['hunt', 'hunt']:
+        parser.error("--batch plays hunt against hunt only")
+
+    tournament = Tournament(args.players, board_size=args.board_size, workers=args.workers,
+                            chunk_size=args.chunk_size, height=args.height, batch=args.batch)
+    for key, value in tournament.run(args.games, args.seed).summary().items():
+        print(f"{key}: {value}")